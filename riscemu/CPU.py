@@ -7,7 +7,7 @@ This file contains the CPU logic (not the individual instruction sets). See inst
 on them.
 """
 import typing
-from typing import List, Type
+from typing import List, Type, Dict, Tuple, Callable
 
 import riscemu
 from .config import RunConfig
@@ -16,12 +16,19 @@ from .colors import FMT_CPU, FMT_NONE, FMT_ERROR
 from .debug import launch_debug_session
 from .types.exceptions import RiscemuBaseException, LaunchDebuggerException, StackOverflowException
 from .syscall import SyscallInterface, get_syscall_symbols
-from .types import CPU, ProgramLoader, Int32, BinaryDataMemorySection
+from .types import CPU, ProgramLoader, Int32, BinaryDataMemorySection, Instruction, DecodedInstruction, \
+    T_AbsoluteAddress
+from .registers import REGISTER_INDICES
 from .parser import AssemblyFileLoader
+from .jit import compile_block
 
 if typing.TYPE_CHECKING:
     from .instructions.instruction_set import InstructionSet
 
+T_DecodedInstruction = Tuple[Callable[[Instruction], None], Instruction]
+
+SP_INDEX = REGISTER_INDICES['sp']
+
 
 class UserModeCPU(CPU):
     """
@@ -30,6 +37,11 @@ class UserModeCPU(CPU):
     It is initialized with a configuration and a list of instruction sets.
     """
 
+    JIT_THRESHOLD = 50
+    """
+    Number of times a basic block is interpreted before it is compiled into a Python function, see riscemu.jit
+    """
+
     def __init__(self, instruction_sets: List[Type['riscemu.InstructionSet']], conf: RunConfig):
         """
         Creates a CPU instance.
@@ -41,6 +53,15 @@ class UserModeCPU(CPU):
 
         self.exit_code = 0
 
+        # maps the address of each executed instruction to its handler and the instruction itself
+        self._decode_cache: Dict[T_AbsoluteAddress, T_DecodedInstruction] = dict()
+        # maps the start address of each executed basic block to the decoded instructions in it
+        self._block_cache: Dict[T_AbsoluteAddress, List[T_DecodedInstruction]] = dict()
+        # counts how often each basic block was interpreted, and holds the compiled version of hot blocks
+        self._block_counts: Dict[T_AbsoluteAddress, int] = dict()
+        self._compiled_blocks: Dict[T_AbsoluteAddress, Callable[[bool], None]] = dict()
+        self.mmu.code_write_listeners.append(self._invalidate_decode_cache)
+
         # setup syscall interface
         self.syscall_int = SyscallInterface()
 
@@ -60,34 +81,211 @@ class UserModeCPU(CPU):
         launch_debugger = False
 
         try:
-            if self.regs.get('sp') < self.conf.stack_size - 4096:
-                raise StackOverflowException("You have run out of space on the stack. This is likely due to infinite recursion or improper stack discipline.")
             self.cycle += 1
-            ins = self.mmu.read_ins(self.pc)
+            entry = self._decode_cache.get(self.pc)
+            if entry is None:
+                entry = self._decode(self.pc)
+            handler, ins = entry
             if verbose:
                 print(FMT_CPU + "   Running 0x{:08X}:{} {}".format(self.pc, FMT_NONE, ins))
             self.pc += self.INS_XLEN
-            self.run_instruction(ins)
+            handler(ins)
+        except RiscemuBaseException as ex:
+            launch_debugger = self._handle_exception(ex)
+
+        if launch_debugger:
+            launch_debug_session(self)
+
+    def step_block(self):
+        """
+        Execute the whole basic block starting at the current pc, then return.
+        """
+        launch_debugger = False
+
+        try:
+            self._execute_block()
         except RiscemuBaseException as ex:
-            if isinstance(ex, LaunchDebuggerException):
-                # if the debugger is active, raise the exception to
-                if self.debugger_active:
-                    raise ex
-
-                print(FMT_CPU + '[CPU] Debugger launch requested!' + FMT_NONE)
-                launch_debugger = True
-            else:
-                print(ex.message())
-                ex.print_stacktrace()
-                print(FMT_CPU + '[CPU] Halting due to exception!' + FMT_NONE)
-                self.halted = True
+            launch_debugger = self._handle_exception(ex)
 
         if launch_debugger:
             launch_debug_session(self)
 
+    def _run_blocks(self):
+        """
+        Execute basic blocks until the CPU halts or an exception is raised
+        """
+        launch_debugger = False
+
+        try:
+            # dispatch compiled blocks directly by address, only cold blocks go through _execute_block
+            compiled_blocks = self._compiled_blocks
+            execute_block = self._execute_block
+            while not self.halted:
+                compiled = compiled_blocks.get(self.pc)
+                if compiled is not None:
+                    compiled()
+                else:
+                    execute_block()
+        except RiscemuBaseException as ex:
+            launch_debugger = self._handle_exception(ex)
+
+        if launch_debugger:
+            launch_debug_session(self)
+
+    def _execute_block(self):
+        """
+        Execute the basic block starting at the current pc, compiling it once it gets hot
+        """
+        start = self.pc
+        compiled = self._compiled_blocks.get(start)
+        if compiled is not None:
+            compiled(False)
+            return
+        block = self._block_cache.get(start)
+        if block is None:
+            try:
+                block = self._build_block(start)
+            except (RiscemuBaseException, RuntimeError):
+                # like step, count the cycle of an instruction failing to decode
+                self.cycle += 1
+                raise
+        # instructions in a block are consecutive, only the last one should jump or halt. A handler doing so anyway
+        # ends the block right there.
+        pc, xlen = start, self.INS_XLEN
+        for handler, ins in block:
+            pc += xlen
+            self.pc = pc
+            self.cycle += 1
+            handler(ins)
+            if self.pc != pc or self.halted:
+                break
+        count = self._block_counts[start] = self._block_counts.get(start, 0) + 1
+        if count >= self.JIT_THRESHOLD and start in self._block_cache:
+            self._compiled_blocks[start] = compile_block(self, start, block, self._compiled_blocks)
+
+    def _handle_exception(self, ex: RiscemuBaseException) -> bool:
+        """
+        Handle an exception raised while executing instructions
+
+        :return: True if the debugger should be launched
+        """
+        if isinstance(ex, LaunchDebuggerException):
+            # if the debugger is active, raise the exception to
+            if self.debugger_active:
+                raise ex
+
+            print(FMT_CPU + '[CPU] Debugger launch requested!' + FMT_NONE)
+            return True
+
+        print(ex.message())
+        ex.print_stacktrace()
+        print(FMT_CPU + '[CPU] Halting due to exception!' + FMT_NONE)
+        self.halted = True
+        return False
+
+    def _decode(self, addr: T_AbsoluteAddress) -> T_DecodedInstruction:
+        """
+        Fetch the instruction at addr, resolve its handler and store both in the decode cache
+        """
+        # decoding may replace the instruction by an equivalent, simpler one, so look up the handler afterwards
+        ins = self.decode_instruction(self.mmu.read_ins(addr))
+        entry = self._decode_cache[addr] = (self._get_handler(ins), ins)
+        return entry
+
+    def _get_handler(self, ins: Instruction) -> Callable[[Instruction], None]:
+        """
+        Look up the handler executing ins
+        """
+        handler = self.instructions[ins.name]
+        if self._may_write_sp(ins):
+            handler = self._with_stack_check(handler)
+        return handler
+
+    @staticmethod
+    def _may_write_sp(ins: Instruction) -> bool:
+        """
+        Check if executing ins can change the stack pointer
+        """
+        if isinstance(ins, DecodedInstruction):
+            return ins.rd == SP_INDEX
+        # operands of undecoded instructions are unknown, so assume any instruction mentioning sp may write it
+        return any(arg in ('sp', 'x2') for arg in ins.args)
+
+    def _with_stack_check(self, handler: Callable[[Instruction], None]) -> Callable[[Instruction], None]:
+        """
+        Wrap the handler of an instruction writing sp, so it checks for a stack overflow afterwards
+        """
+        vals = self.regs.vals
+        stack_limit = self.conf.stack_size - 4096
+
+        def checked_handler(ins: Instruction):
+            handler(ins)
+            if vals[SP_INDEX] < stack_limit:
+                raise StackOverflowException("You have run out of space on the stack. This is likely due to infinite recursion or improper stack discipline.")
+
+        return checked_handler
+
+    def _invalidate_decode_cache(self, addr: T_AbsoluteAddress, size: int):
+        """
+        Drop all cached instructions overlapping the memory region [addr, addr + size)
+        """
+        for ins_addr in range(addr - (addr % self.INS_XLEN), addr + size, self.INS_XLEN):
+            self._decode_cache.pop(ins_addr, None)
+        self._block_cache.clear()
+        self._block_counts.clear()
+        self._compiled_blocks.clear()
+
+    def _build_block(self, addr: T_AbsoluteAddress) -> List[T_DecodedInstruction]:
+        """
+        Decode the straight-line run of instructions starting at addr, up to and including the first control flow
+        instruction, and store it in the block cache
+        """
+        start = addr
+        block = [self._decode_cache.get(addr) or self._decode(addr)]
+        while not self._ends_block(block[-1][1]):
+            addr += self.INS_XLEN
+            entry = self._decode_cache.get(addr)
+            if entry is None:
+                try:
+                    entry = self._decode(addr)
+                except (RiscemuBaseException, RuntimeError):
+                    # end the block here, the error is raised once execution actually reaches this address
+                    break
+            block.append(entry)
+        self._fuse_block(start, block)
+        self._block_cache[start] = block
+        return block
+
+    def _ends_block(self, ins: Instruction) -> bool:
+        """
+        Check if ins may change the pc or halt the CPU, so it has to be the last instruction of its basic block
+        """
+        return ins.name in self.control_flow_instructions or not isinstance(ins, DecodedInstruction)
+
+    def _fuse_block(self, addr: T_AbsoluteAddress, block: List[T_DecodedInstruction]):
+        """
+        Replace consecutive pairs of instructions in block by cheaper ones, see InstructionSet.fuse
+        """
+        for i in range(len(block) - 1):
+            first, second = block[i][1], block[i + 1][1]
+            if not isinstance(first, DecodedInstruction) or not isinstance(second, DecodedInstruction):
+                continue
+            # the stack pointer has to be checked after every single instruction writing it
+            if self._may_write_sp(first) or self._may_write_sp(second):
+                continue
+            fused = self.fusers[first.name](first, second, addr + (i + 1) * self.INS_XLEN)
+            if fused is not None:
+                block[i] = (self._get_handler(fused[0]), fused[0])
+                block[i + 1] = (self._get_handler(fused[1]), fused[1])
+
     def run(self, verbose=False):
-        while not self.halted:
-            self.step(verbose)
+        if verbose:
+            while not self.halted:
+                self.step(verbose)
+        else:
+            # _run_blocks only returns after the cpu halted, or an exception was handled
+            while not self.halted:
+                self._run_blocks()
 
         if self.conf.verbosity > 0:
             print(FMT_CPU + "[CPU] Program exited with code {}".format(self.exit_code) + FMT_NONE)
@@ -4,14 +4,20 @@ RiscEmu (c) 2021 Anton Lydike
 SPDX-License-Identifier: MIT
 """
 
-from typing import Dict, List, Optional, Union
+from struct import Struct
+from typing import Callable, Dict, List, Optional, Union
 
 from .colors import *
 from .helpers import align_addr
 from .types import Instruction, MemorySection, MemoryFlags, T_AbsoluteAddress, \
-    Program, InstructionContext, Int32
+    Program, InstructionContext, Int32, BinaryDataMemorySection
 from .types.exceptions import InvalidAllocationException, MemoryAccessException
 
+MEM_STRUCTS = {1: Struct('<B'), 2: Struct('<H'), 4: Struct('<I')}
+"""
+Structs for reading and writing little-endian unsigned values of 1, 2 and 4 bytes
+"""
+
 
 class MMU:
     """
@@ -45,6 +51,11 @@ class MMU:
     The global symbol table
     """
 
+    code_write_listeners: List[Callable[[T_AbsoluteAddress, int], None]]
+    """
+    Callbacks which are called with (addr, size) whenever memory inside an executable section is written
+    """
+
     def __init__(self):
         """
         Create a new MMU
@@ -52,6 +63,9 @@ class MMU:
         self.programs = list()
         self.sections = list()
         self.global_symbols = dict()
+        self.code_write_listeners = list()
+        # the section of the last instruction fetch, most fetches hit the same section again
+        self._last_ins_sec: Optional[MemorySection] = None
 
     def get_sec_containing(self, addr: T_AbsoluteAddress) -> Optional[MemorySection]:
         """
@@ -65,6 +79,21 @@ class MMU:
                 return sec
         return None
 
+    def get_direct_access_sec(self, addr: T_AbsoluteAddress) -> Optional[BinaryDataMemorySection]:
+        """
+        Returns the section containing addr, if its data can be accessed directly, bypassing the MMU
+
+        This is only the case for plain, non-executable BinaryDataMemorySections, as writes to executable sections
+        have to be reported to the code_write_listeners, and subclasses may add their own checks.
+
+        :param addr: the Address to look for
+        :return: The BinaryDataMemorySection or None
+        """
+        sec = self.get_sec_containing(addr)
+        if type(sec) is BinaryDataMemorySection and not sec.flags.executable:
+            return sec
+        return None
+
     def get_bin_containing(self, addr: T_AbsoluteAddress) -> Optional[Program]:
         for program in self.programs:
             if program.base <= addr < program.base + program.size:
@@ -78,11 +107,14 @@ class MMU:
         :param addr: The location
         :return: The Instruction
         """
-        sec = self.get_sec_containing(addr)
-        if sec is None:
-            print(FMT_MEM + "[MMU] Trying to read instruction form invalid region! (read at {}) ".format(addr)
-                  + "Have you forgotten an exit syscall or ret statement?" + FMT_NONE)
-            raise RuntimeError("No next instruction available!")
+        sec = self._last_ins_sec
+        if sec is None or not sec.base <= addr < sec.base + sec.size:
+            sec = self.get_sec_containing(addr)
+            if sec is None:
+                print(FMT_MEM + "[MMU] Trying to read instruction form invalid region! (read at {}) ".format(addr)
+                      + "Have you forgotten an exit syscall or ret statement?" + FMT_NONE)
+                raise RuntimeError("No next instruction available!")
+            self._last_ins_sec = sec
         return sec.read_ins(addr - sec.base)
 
     def read(self, addr: Union[int, Int32], size: int) -> bytearray:
@@ -102,20 +134,54 @@ class MMU:
             raise MemoryAccessException("region is non-initialized!", addr, size, 'read')
         return sec.read(addr - sec.base, size)
 
-    def write(self, addr: int, size: int, data: bytearray):
+    def read_uint(self, addr: int, size: int) -> int:
+        """
+        Read size bytes of memory at addr as an unsigned little-endian integer
+
+        Plain data sections are read in place, without copying the bytes out first.
+
+        :param addr: The addres at which to start reading
+        :param size: The number of bytes to read, 1, 2 or 4
+        :return: The value at addr
+        """
+        sec = self.get_sec_containing(addr)
+        if sec is None:
+            print(FMT_MEM + "[MMU] Trying to read data form invalid region at 0x{:x}! ".format(addr) + FMT_NONE)
+            raise MemoryAccessException("region is non-initialized!", addr, size, 'read')
+        offset = addr - sec.base
+        if type(sec) is BinaryDataMemorySection and offset + size <= sec.size:
+            return MEM_STRUCTS[size].unpack_from(sec.data, offset)[0]
+        return int.from_bytes(sec.read(offset, size), 'little')
+
+    def write(self, addr: int, size: int, data: Union[bytearray, int]):
         """
         Write bytes into memory
 
         :param addr: The address at which to write
         :param size: The number of bytes to write
-        :param data: The bytearray to write (only first size bytes are written)
+        :param data: The bytearray to write (only first size bytes are written), or an int, of which the lowest size
+                     bytes are written in little-endian order
         """
         sec = self.get_sec_containing(addr)
         if sec is None:
             print(FMT_MEM + '[MMU] Invalid write into non-initialized region at 0x{:08X}'.format(addr) + FMT_NONE)
             raise MemoryAccessException("region is non-initialized!", addr, size, 'write')
 
-        return sec.write(addr - sec.base, size, data)
+        offset = addr - sec.base
+        if isinstance(data, int):
+            data &= (1 << (8 * size)) - 1
+            if type(sec) is BinaryDataMemorySection and size in MEM_STRUCTS and offset + size <= sec.size:
+                # plain data sections are written in place
+                MEM_STRUCTS[size].pack_into(sec.data, offset, data)
+            else:
+                sec.write(offset, size, data.to_bytes(size, 'little'))
+        else:
+            sec.write(offset, size, data)
+
+        # tell everyone caching decoded instructions that code changed (self-modifying code)
+        if sec.flags.executable:
+            for listener in self.code_write_listeners:
+                listener(addr, size)
 
     def dump(self, addr, *args, **kwargs):
         """
@@ -1,6 +1,15 @@
+from typing import Callable
+
 from .instruction_set import InstructionSet, Instruction
 from riscemu.types.exceptions import INS_NOT_IMPLEMENTED
-from ..types import Int32, UInt32
+from ..types import DecodedInstruction
+
+
+def _signed(val: int) -> int:
+    """
+    Interpret a raw register value as a signed 32 bit integer
+    """
+    return (val ^ 0x80000000) - 0x80000000
 
 
 class RV32A(InstructionSet):
@@ -8,71 +17,54 @@ class RV32A(InstructionSet):
     The RV32A instruction set. Currently, load-reserved and store conditionally are not supported
     due to limitations in the way the MMU is implemented. Maybe a later implementation will add support
     for this?
+
+    The atomic memory operations are written as <name> rd, rs1, rs2, where rs1 holds the address and rs2 the operand.
     """
 
+    operand_formats = dict.fromkeys((
+        'amoswap.w', 'amoadd.w', 'amoand.w', 'amoor.w', 'amoxor.w',
+        'amomax.w', 'amomaxu.w', 'amomin.w', 'amominu.w',
+    ), ('rd', 'rs1', 'rs2'))
+
     def instruction_lr_w(self, ins: 'Instruction'):
         INS_NOT_IMPLEMENTED(ins)
 
     def instruction_sc_w(self, ins: 'Instruction'):
         INS_NOT_IMPLEMENTED(ins)
 
-    def instruction_amoswap_w(self, ins: 'Instruction'):
-        dest, addr, val = self.parse_rd_rs_rs(ins)
-        if dest == 'zero':
-            self.mmu.write(addr, val.to_bytes())
-        else:
-            old = Int32(self.mmu.read(addr, 4))
-            self.mmu.write(addr, val.to_bytes())
-            self.regs.set(dest, old)
-
-    def instruction_amoadd_w(self, ins: 'Instruction'):
-        dest, addr, val = self.parse_rd_rs_rs(ins)
-        old = Int32(self.mmu.read(addr, 4))
-        self.mmu.write(addr, (old + val).to_bytes(4))
-        self.regs.set(dest, old)
-
-    def instruction_amoand_w(self, ins: 'Instruction'):
-        dest, addr, val = self.parse_rd_rs_rs(ins)
-        old = Int32(self.mmu.read(addr, 4))
-        self.mmu.write(addr, (old & val).to_bytes(4))
-        self.regs.set(dest, old)
-
-    def instruction_amoor_w(self, ins: 'Instruction'):
-        dest, addr, val = self.parse_rd_rs_rs(ins)
-        old = Int32(self.mmu.read(addr, 4))
-        self.mmu.write(addr, (old | val).to_bytes(4))
-        self.regs.set(dest, old)
-
-    def instruction_amoxor_w(self, ins: 'Instruction'):
-        dest, addr, val = self.parse_rd_rs_rs(ins)
-        old = Int32(self.mmu.read(addr, 4))
-        self.mmu.write(addr, (old ^ val).to_bytes(4))
-        self.regs.set(dest, old)
-
-    def instruction_amomax_w(self, ins: 'Instruction'):
-        dest, addr, val = self.parse_rd_rs_rs(ins)
-        old = Int32(self.mmu.read(addr, 4))
-        self.mmu.write(addr, max(old, val).to_bytes(4))
-        self.regs.set(dest, old)
-
-    def instruction_amomaxu_w(self, ins: 'Instruction'):
-        val: UInt32
-        dest, addr, val = self.parse_rd_rs_rs(ins, signed=False)
-        old = UInt32(self.mmu.read(addr, 4))
-
-        self.mmu.write(addr, max(old, val).to_bytes())
-        self.regs.set(dest, old)
-
-    def instruction_amomin_w(self, ins: 'Instruction'):
-        dest, addr, val = self.parse_rd_rs_rs(ins)
-        old = Int32(self.mmu.read(addr, 4))
-        self.mmu.write(addr, min(old, val).to_bytes(4))
-        self.regs.set(dest, old)
-
-    def instruction_amominu_w(self, ins: 'Instruction'):
-        val: UInt32
-        dest, addr, val = self.parse_rd_rs_rs(ins, signed=False)
-        old = UInt32(self.mmu.read(addr, 4))
-
-        self.mmu.write(addr, min(old, val).to_bytes(4))
-        self.regs.set(dest, old)
+    def _amo(self, ins: 'DecodedInstruction', op: Callable[[int, int], int]):
+        """
+        Replace the word at the address in rs1 by op(old, rs2) and load the old word into rd
+        """
+        vals = self.vals
+        addr = vals[ins.rs1]
+        old = self.read_mem(ins, addr, 4)
+        self.write_mem(ins, addr, 4, op(old, vals[ins.rs2]))
+        vals[ins.rd] = old
+
+    def instruction_amoswap_w(self, ins: 'DecodedInstruction'):
+        self._amo(ins, lambda old, val: val)
+
+    def instruction_amoadd_w(self, ins: 'DecodedInstruction'):
+        self._amo(ins, lambda old, val: old + val)
+
+    def instruction_amoand_w(self, ins: 'DecodedInstruction'):
+        self._amo(ins, lambda old, val: old & val)
+
+    def instruction_amoor_w(self, ins: 'DecodedInstruction'):
+        self._amo(ins, lambda old, val: old | val)
+
+    def instruction_amoxor_w(self, ins: 'DecodedInstruction'):
+        self._amo(ins, lambda old, val: old ^ val)
+
+    def instruction_amomax_w(self, ins: 'DecodedInstruction'):
+        self._amo(ins, lambda old, val: max(old, val, key=_signed))
+
+    def instruction_amomaxu_w(self, ins: 'DecodedInstruction'):
+        self._amo(ins, max)
+
+    def instruction_amomin_w(self, ins: 'DecodedInstruction'):
+        self._amo(ins, lambda old, val: min(old, val, key=_signed))
+
+    def instruction_amominu_w(self, ins: 'DecodedInstruction'):
+        self._amo(ins, min)
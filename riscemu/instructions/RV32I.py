@@ -4,13 +4,45 @@ RiscEmu (c) 2021 Anton Lydike
 SPDX-License-Identifier: MIT
 """
 
+from struct import Struct
+
 from .instruction_set import *
 from ..CPU import UserModeCPU
 
 from ..colors import FMT_DEBUG, FMT_NONE
+from ..jit import jit_template
+from ..registers import REGISTER_INDICES
 from riscemu.types.exceptions import LaunchDebuggerException
 from ..syscall import Syscall
-from ..types import Instruction, Int32, UInt32
+from ..types import Instruction, DecodedInstruction
+from ..MMU import MEM_STRUCTS
+
+
+def _mem_access_template(size: int, access: str) -> str:
+    """
+    JIT template for a load or store of size bytes, accessing the section cached by read_mem/write_mem directly
+
+    access is the statement reading or writing the data of section s at offset o. Misaligned words, other sections
+    and the first execution of the instruction are left to the handler.
+    """
+    aligned = ' and not a & 0b11' if size == 4 else ''
+    return (
+        'a = (vals[{rs1}] + {imm}) & 0xFFFFFFFF\n'
+        's = {ins}.mem_sec\n'
+        'if s is not None%s and 0 <= a - s.base <= s.size - %d:\n'
+        '    o = a - s.base\n'
+        '    %s\n'
+        'else:\n'
+        '    {fallback}'
+    ) % (aligned, size, access)
+
+
+_MEM_BINDINGS = {
+    'unpack_half': MEM_STRUCTS[2].unpack_from, 'unpack_word': MEM_STRUCTS[4].unpack_from,
+    'pack_half': MEM_STRUCTS[2].pack_into, 'pack_word': MEM_STRUCTS[4].pack_into,
+    # sign extends the loaded half word itself
+    'unpack_signed_half': Struct('<h').unpack_from,
+}
 
 
 class RV32I(InstructionSet):
@@ -20,462 +52,466 @@ class RV32I(InstructionSet):
     All atomic read/writes are also not implemented yet
 
     See https://maxvytech.com/images/RV32I-11-2018.pdf for a more detailed overview
+
+    Register contents are raw unsigned 32 bit integers, handlers of decoded instructions work on them directly.
     """
 
-    def instruction_lb(self, ins: 'Instruction'):
-
-        rd, addr = self.parse_mem_ins(ins)
-        self.regs.set(rd, Int32.sign_extend(self.mmu.read(addr.unsigned_value, 1), 8))
-
-    def instruction_lh(self, ins: 'Instruction'):
-        rd, addr = self.parse_mem_ins(ins)
-        self.regs.set(rd, Int32.sign_extend(self.mmu.read(addr.unsigned_value, 2), 16))
-
-    def instruction_lw(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3) # this is how we teach it
-        rd, addr = self.parse_mem_ins(ins)
-        ASSERT_WORD_ALIGNED(addr.unsigned_value, "lw {}, {}({})".format(ins.get_reg(0), ins.get_imm(2), ins.get_reg(1)))
-        self.regs.set(rd, Int32(self.mmu.read(addr.unsigned_value, 4)))
-
-    def instruction_lbu(self, ins: 'Instruction'):
-        rd, addr = self.parse_mem_ins(ins)
-        self.regs.set(rd, Int32(self.mmu.read(addr.unsigned_value, 1)))
-
-    def instruction_lhu(self, ins: 'Instruction'):
-        rd, addr = self.parse_mem_ins(ins)
-        self.regs.set(rd, Int32(self.mmu.read(addr.unsigned_value, 2)))
-
-    def instruction_sb(self, ins: 'Instruction'):
-        rd, addr = self.parse_mem_ins(ins)
-        self.mmu.write(addr.unsigned_value, 1, self.regs.get(rd).to_bytes(1))
-
-    def instruction_sh(self, ins: 'Instruction'):
-        rd, addr = self.parse_mem_ins(ins)
-        self.mmu.write(addr.unsigned_value, 2, self.regs.get(rd).to_bytes(2))
-
-    def instruction_sw(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3) # this is how we do it
-        rd, addr = self.parse_mem_ins(ins)
-        ASSERT_WORD_ALIGNED(addr.unsigned_value, "sw {}, {}({})".format(ins.get_reg(0), ins.get_imm(2), ins.get_reg(1)))
-        self.mmu.write(addr.unsigned_value, 4, self.regs.get(rd).to_bytes(4))
-
-    def instruction_sll(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        dst = ins.get_reg(0)
-        src1 = ins.get_reg(1)
-        src2 = ins.get_reg(2)
-        self.regs.set(
-            dst,
-            self.regs.get(src1) << (self.regs.get(src2) & 0b11111)
-        )
-
-    def instruction_slli(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        dst = ins.get_reg(0)
-        src1 = ins.get_reg(1)
-        imm = ins.get_imm(2)
-        self.regs.set(
-            dst,
-            self.regs.get(src1) << (imm & 0b11111)
-        )
-
-    def instruction_srl(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        dst = ins.get_reg(0)
-        src1 = ins.get_reg(1)
-        src2 = ins.get_reg(2)
-        self.regs.set(
-            dst,
-            self.regs.get(src1).shift_right_logical(self.regs.get(src2) & 0b11111)
-        )
-
-    def instruction_srli(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        dst = ins.get_reg(0)
-        src1 = ins.get_reg(1)
-        imm = ins.get_imm(2)
-        self.regs.set(
-            dst,
-            self.regs.get(src1).shift_right_logical(imm & 0b11111)
-        )
-
-    def instruction_sra(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        dst = ins.get_reg(0)
-        src1 = ins.get_reg(1)
-        src2 = ins.get_reg(2)
-        self.regs.set(
-            dst,
-            Int32(self.regs.get(src1)) >> (self.regs.get(src2) & 0b11111)
-        )
-
-    def instruction_srai(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        dst = ins.get_reg(0)
-        src1 = ins.get_reg(1)
-        imm = ins.get_imm(2)
-        self.regs.set(
-            dst,
-            Int32(self.regs.get(src1)) >> (imm & 0b11111)
-        )
-
-    def instruction_add(self, ins: 'Instruction'):
+    operand_formats = {
+        **dict.fromkeys(('add', 'sub', 'xor', 'or', 'and', 'slt', 'sltu', 'sll', 'srl', 'sra'), ('rd', 'rs1', 'rs2')),
+        **dict.fromkeys(('mv', 'neg', 'not'), ('rd', 'rs1')),
+        **dict.fromkeys(('addi', 'xori', 'ori', 'andi', 'slti'), ('rd', 'rs1', 'simm12')),
+        'sltiu': ('rd', 'rs1', 'uimm12'),
+        **dict.fromkeys(('slli', 'srli', 'srai'), ('rd', 'rs1', 'shamt')),
+        'lui': ('rd', 'uimm20'),
+        **dict.fromkeys(('auipc', 'li', 'la'), ('rd', 'imm')),
+        **dict.fromkeys(('lb', 'lh', 'lw', 'lbu', 'lhu'), ('rd', 'rs1', 'imm')),
+        **dict.fromkeys(('sb', 'sh', 'sw'), ('rs2', 'rs1', 'imm')),
+        **dict.fromkeys(('beq', 'bne', 'blt', 'bge', 'bgt', 'ble'), ('rs1', 'rs2', 'target12')),
+        **dict.fromkeys(('bltu', 'bgeu', 'bgtu', 'bleu'), ('rs1', 'rs2', 'uimm12')),
+        **dict.fromkeys(('beqz', 'bnez', 'bltz', 'bgez', 'bgtz', 'blez'), ('rs1', 'imm')),
+        **dict.fromkeys(('j', 'call'), ('imm',)),
+        'jr': ('rs1',),
+        # the short forms of jal and jalr link to ra, see specialize
+        'jal': {1: ('imm',), 2: ('rd', 'imm')},
+        'jalr': {1: ('rs1',), 3: ('rd', 'rs1', 'imm')},
+        **dict.fromkeys(('ret', 'nop', 'startlog', 'stoplog', 'csbreak', 'ecall', 'ebreak', 'scall', 'sbreak'), ()),
+    }
+
+    control_flow_instructions = frozenset((
+        'beq', 'bne', 'blt', 'bge', 'bltu', 'bgeu', 'bgt', 'ble', 'bgtu', 'bleu',
+        'beqz', 'bnez', 'bltz', 'bgez', 'bgtz', 'blez',
+        'j', 'jal', 'jalr', 'jr', 'ret', 'call',
+        'ecall', 'ebreak', 'scall', 'sbreak',
+    ))
+
+    _NO_SIDE_EFFECTS = frozenset((
+        'add', 'sub', 'xor', 'or', 'and', 'slt', 'sltu', 'sll', 'srl', 'sra', 'mv', 'neg', 'not',
+        'addi', 'xori', 'ori', 'andi', 'slti', 'sltiu', 'slli', 'srli', 'srai', 'lui', 'auipc', 'li', 'la',
+    ))
+    """
+    Instructions which only write their result to rd, so they do nothing when rd is zero
+    """
+
+    _ZERO_BRANCHES = {
+        # (name, operand compared against zero): equivalent pseudo branch
+        ('beq', 'rs1'): 'beqz', ('bne', 'rs1'): 'bnez', ('blt', 'rs1'): 'bltz', ('bge', 'rs1'): 'bgez',
+        ('beq', 'rs2'): 'beqz', ('bne', 'rs2'): 'bnez', ('blt', 'rs2'): 'bgtz', ('bge', 'rs2'): 'blez',
+    }
+
+    def __init__(self, cpu: 'CPU'):
+        super().__init__(cpu)
+        # syscalls are only supported by the user mode cpu, this can't change while running
+        self._is_user_mode = isinstance(cpu, UserModeCPU)
+        # ecall and ebreak are the same instructions as scall and sbreak, so they are executed by the same handlers,
+        # unless a subclass implements them itself
+        for alias, name in (('ecall', 'scall'), ('ebreak', 'sbreak')):
+            if self.handler_functions[alias] is RV32I.handler_functions[alias]:
+                self.handlers[alias] = self.handlers[name]
+
+    def specialize(self, ins: 'DecodedInstruction') -> 'DecodedInstruction':
+        """
+        x0 is wired to zero, so instructions reading or writing it are replaced by simpler ones, e.g.
+        add rd, x0, rs becomes mv rd, rs and beq rs, x0, target becomes beqz rs, target
+        """
+        name = ins.name
+        if name in ('jal', 'jalr') and len(ins.args) == 1:
+            ins.rd = REGISTER_INDICES['ra']
+        elif name == 'jal' and ins.rd == Registers.ZERO_SINK:
+            ins.name = 'j'
+        elif ins.rd == Registers.ZERO_SINK and name in self._NO_SIDE_EFFECTS:
+            ins.name = 'nop'
+        elif name in ('add', 'or', 'xor') and (ins.rs1 == 0 or ins.rs2 == 0):
+            ins.name, ins.rs1 = 'mv', ins.rs1 or ins.rs2
+        elif name in ('sub', 'sll', 'srl', 'sra') and ins.rs2 == 0:
+            ins.name = 'mv'
+        elif name == 'sub' and ins.rs1 == 0:
+            ins.name, ins.rs1 = 'neg', ins.rs2
+        elif name in ('addi', 'ori', 'xori', 'slli', 'srli', 'srai') and ins.imm == 0:
+            ins.name = 'mv'
+        elif name in ('addi', 'ori', 'xori') and ins.rs1 == 0:
+            ins.name = 'li'
+        elif name == 'xori' and ins.imm == -1:
+            ins.name = 'not'
+        elif name in ('beq', 'bne', 'blt', 'bge') and (ins.rs1 == 0 or ins.rs2 == 0):
+            if ins.rs2 == 0:
+                ins.name = self._ZERO_BRANCHES[(name, 'rs1')]
+            else:
+                ins.name, ins.rs1 = self._ZERO_BRANCHES[(name, 'rs2')], ins.rs2
+        return ins
+
+    def fuse(self, first: 'DecodedInstruction', second: 'DecodedInstruction', pc: int) \
+            -> Optional[Tuple['DecodedInstruction', 'DecodedInstruction']]:
+        """
+        lui or auipc followed by an addi to the same register loads a constant, two consecutive addi to the same
+        register add the sum of their immediates. Both are replaced by a single instruction, followed by a nop.
+        """
+        if second.name != 'addi' or second.rd != first.rd or second.rs1 != first.rd:
+            return None
+        if first.name == 'lui':
+            fused = first.copy()
+            fused.name, fused.imm = 'li', (first.imm << 12) + second.imm
+        elif first.name == 'auipc':
+            fused = first.copy()
+            fused.name, fused.imm = 'li', (first.imm << 12) + pc + second.imm
+        elif first.name == 'addi':
+            fused = first.copy()
+            fused.imm = first.imm + second.imm
+        else:
+            return None
+        nop = second.copy()
+        nop.name = 'nop'
+        return fused, nop
+
+    @jit_template(_mem_access_template(1, 'vals[{rd}] = ((s.data[o] ^ 0x80) - 0x80) & 0xFFFFFFFF'), **_MEM_BINDINGS)
+    def instruction_lb(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        val = self.read_mem(ins, (vals[ins.rs1] + ins.imm) & 0xFFFFFFFF, 1)
+        vals[ins.rd] = ((val ^ 0x80) - 0x80) & 0xFFFFFFFF
+
+    @jit_template(_mem_access_template(2, 'vals[{rd}] = unpack_signed_half(s.data, o)[0] & 0xFFFFFFFF'), **_MEM_BINDINGS)
+    def instruction_lh(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        val = self.read_mem(ins, (vals[ins.rs1] + ins.imm) & 0xFFFFFFFF, 2)
+        vals[ins.rd] = ((val ^ 0x8000) - 0x8000) & 0xFFFFFFFF
+
+    @jit_template(_mem_access_template(4, 'vals[{rd}] = unpack_word(s.data, o)[0]'), **_MEM_BINDINGS)
+    def instruction_lw(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        addr = (vals[ins.rs1] + ins.imm) & 0xFFFFFFFF
+        # the error message is only built if the address is actually misaligned
+        if addr & 0b11:
+            ASSERT_WORD_ALIGNED(addr, ins)
+        vals[ins.rd] = self.read_mem(ins, addr, 4)
+
+    @jit_template(_mem_access_template(1, 'vals[{rd}] = s.data[o]'), **_MEM_BINDINGS)
+    def instruction_lbu(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = self.read_mem(ins, (vals[ins.rs1] + ins.imm) & 0xFFFFFFFF, 1)
+
+    @jit_template(_mem_access_template(2, 'vals[{rd}] = unpack_half(s.data, o)[0]'), **_MEM_BINDINGS)
+    def instruction_lhu(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = self.read_mem(ins, (vals[ins.rs1] + ins.imm) & 0xFFFFFFFF, 2)
+
+    @jit_template(_mem_access_template(1, 's.data[o] = vals[{rs2}] & 0xFF'), **_MEM_BINDINGS)
+    def instruction_sb(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        self.write_mem(ins, (vals[ins.rs1] + ins.imm) & 0xFFFFFFFF, 1, vals[ins.rs2])
+
+    @jit_template(_mem_access_template(2, 'pack_half(s.data, o, vals[{rs2}] & 0xFFFF)'), **_MEM_BINDINGS)
+    def instruction_sh(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        self.write_mem(ins, (vals[ins.rs1] + ins.imm) & 0xFFFFFFFF, 2, vals[ins.rs2])
+
+    @jit_template(_mem_access_template(4, 'pack_word(s.data, o, vals[{rs2}])'), **_MEM_BINDINGS)
+    def instruction_sw(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        addr = (vals[ins.rs1] + ins.imm) & 0xFFFFFFFF
+        # the error message is only built if the address is actually misaligned
+        if addr & 0b11:
+            ASSERT_WORD_ALIGNED(addr, ins)
+        self.write_mem(ins, addr, 4, vals[ins.rs2])
+
+    @jit_template('vals[{rd}] = (vals[{rs1}] << (vals[{rs2}] & 0b11111)) & 0xFFFFFFFF')
+    def instruction_sll(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = (vals[ins.rs1] << (vals[ins.rs2] & 0b11111)) & 0xFFFFFFFF
+
+    @jit_template('vals[{rd}] = (vals[{rs1}] << {imm}) & 0xFFFFFFFF')
+    def instruction_slli(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = (vals[ins.rs1] << ins.imm) & 0xFFFFFFFF
+
+    @jit_template('vals[{rd}] = vals[{rs1}] >> (vals[{rs2}] & 0b11111)')
+    def instruction_srl(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = vals[ins.rs1] >> (vals[ins.rs2] & 0b11111)
+
+    @jit_template('vals[{rd}] = vals[{rs1}] >> {imm}')
+    def instruction_srli(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = vals[ins.rs1] >> ins.imm
+
+    @jit_template('vals[{rd}] = (((vals[{rs1}] ^ 0x80000000) - 0x80000000) >> (vals[{rs2}] & 0b11111)) & 0xFFFFFFFF')
+    def instruction_sra(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        # (x ^ 0x80000000) - 0x80000000 is the signed interpretation of x
+        vals[ins.rd] = (((vals[ins.rs1] ^ 0x80000000) - 0x80000000) >> (vals[ins.rs2] & 0b11111)) & 0xFFFFFFFF
+
+    @jit_template('vals[{rd}] = (((vals[{rs1}] ^ 0x80000000) - 0x80000000) >> {imm}) & 0xFFFFFFFF')
+    def instruction_srai(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = (((vals[ins.rs1] ^ 0x80000000) - 0x80000000) >> ins.imm) & 0xFFFFFFFF
+
+    @jit_template('vals[{rd}] = (vals[{rs1}] + vals[{rs2}]) & 0xFFFFFFFF')
+    def instruction_add(self, ins: 'DecodedInstruction'):
         # FIXME: once configuration is figured out, add flag to support immediate arg in add instruction
-        ASSERT_LEN(ins.args, 3)
-        dst, rs1, rs2 = self.parse_rd_rs_rs(ins)
-
-        self.regs.set(
-            dst,
-            rs1 + rs2
-        )
-
-    def instruction_addi(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        dst, rs1, imm = self.parse_rd_rs_imm(ins)
-        self.regs.set(
-            dst,
-            rs1 + imm
-        )
-
-    def instruction_sub(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        dst, rs1, rs2 = self.parse_rd_rs_rs(ins)
-        self.regs.set(
-            dst,
-            rs1 - rs2
-        )
-
-    def instruction_lui(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 2)
-        ASSERT_IMM_LEN(ins.get_imm(1),20,False)
-        reg = ins.get_reg(0)
-        imm = UInt32(ins.get_imm(1) << 12)
-        self.regs.set(reg, Int32(imm))
-
-    def instruction_auipc(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 2)
-        reg = ins.get_reg(0)
-        imm = UInt32(ins.get_imm(1) << 12)
-        self.regs.set(reg, imm.signed() + self.pc)
-
-    def instruction_xor(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rd, rs1, rs2 = self.parse_rd_rs_rs(ins)
-        self.regs.set(
-            rd,
-            rs1 ^ rs2
-        )
-
-    def instruction_xori(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rd, rs1, imm = self.parse_rd_rs_imm(ins)
-        self.regs.set(
-            rd,
-            rs1 ^ imm
-        )
-
-    def instruction_or(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rd, rs1, rs2 = self.parse_rd_rs_rs(ins)
-        self.regs.set(
-            rd,
-            rs1 | rs2
-        )
-
-    def instruction_ori(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rd, rs1, imm = self.parse_rd_rs_imm(ins)
-        self.regs.set(
-            rd,
-            rs1 | imm
-        )
-
-    def instruction_and(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rd, rs1, rs2 = self.parse_rd_rs_rs(ins)
-        self.regs.set(
-            rd,
-            rs1 & rs2
-        )
-
-    def instruction_andi(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rd, rs1, imm = self.parse_rd_rs_imm(ins)
-        self.regs.set(
-            rd,
-            rs1 & imm
-        )
-
-    def instruction_slt(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rd, rs1, rs2 = self.parse_rd_rs_rs(ins)
-        self.regs.set(
-            rd,
-            Int32(int(rs1 < rs2))
-        )
-
-    def instruction_slti(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rd, rs1, imm = self.parse_rd_rs_imm(ins)
-        #print(f"rs1:{rs1} and imm: {imm}")
-        self.regs.set(
-            rd,
-            Int32(int(rs1 < imm))
-        )
-
-    def instruction_sltu(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        dst, rs1, rs2 = self.parse_rd_rs_rs(ins, signed=False)
-        self.regs.set(
-            dst,
-            Int32(int(rs1 < rs2))
-        )
-
-    def instruction_sltiu(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        dst, rs1, imm = self.parse_rd_rs_imm(ins, signed=False)
-        #print(f"rs1:{rs1} and imm: {imm}")
-        self.regs.set(
-            dst,
-            Int32(int(rs1 < imm))
-        )
-
-    def instruction_beq(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rs1, rs2, dst = self.parse_rs_rs_imm(ins)
-        if rs1 == rs2:
-            self.pc = dst.unsigned_value
-
-    def instruction_bne(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rs1, rs2, dst = self.parse_rs_rs_imm(ins)
-        if rs1 != rs2:
-            self.pc = dst.unsigned_value
-
-    def instruction_blt(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rs1, rs2, dst = self.parse_rs_rs_imm(ins)
-        if rs1 < rs2:
-            self.pc = dst.unsigned_value
-
-    def instruction_bge(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rs1, rs2, dst = self.parse_rs_rs_imm(ins)
-        if rs1 >= rs2:
-            self.pc = dst.unsigned_value
-
-    def instruction_bltu(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rs1, rs2, dst = self.parse_rs_rs_imm(ins, signed=False)
-        if rs1 < rs2:
-            self.pc = dst.unsigned_value
-
-    def instruction_bgeu(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rs1, rs2, dst = self.parse_rs_rs_imm(ins, signed=False)
-        if rs1 >= rs2:
-            self.pc = dst.unsigned_value
+        vals = self.vals
+        vals[ins.rd] = (vals[ins.rs1] + vals[ins.rs2]) & 0xFFFFFFFF
+
+    @jit_template('vals[{rd}] = (vals[{rs1}] + {imm}) & 0xFFFFFFFF')
+    def instruction_addi(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = (vals[ins.rs1] + ins.imm) & 0xFFFFFFFF
+
+    @jit_template('vals[{rd}] = (vals[{rs1}] - vals[{rs2}]) & 0xFFFFFFFF')
+    def instruction_sub(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = (vals[ins.rs1] - vals[ins.rs2]) & 0xFFFFFFFF
+
+    @jit_template('vals[{rd}] = ({imm} << 12) & 0xFFFFFFFF')
+    def instruction_lui(self, ins: 'DecodedInstruction'):
+        self.vals[ins.rd] = (ins.imm << 12) & 0xFFFFFFFF
+
+    @jit_template('vals[{rd}] = (({imm} << 12) + {pc}) & 0xFFFFFFFF')
+    def instruction_auipc(self, ins: 'DecodedInstruction'):
+        self.vals[ins.rd] = ((ins.imm << 12) + self.pc) & 0xFFFFFFFF
+
+    @jit_template('vals[{rd}] = vals[{rs1}] ^ vals[{rs2}]')
+    def instruction_xor(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = vals[ins.rs1] ^ vals[ins.rs2]
+
+    @jit_template('vals[{rd}] = (vals[{rs1}] ^ {imm}) & 0xFFFFFFFF')
+    def instruction_xori(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = (vals[ins.rs1] ^ ins.imm) & 0xFFFFFFFF
+
+    @jit_template('vals[{rd}] = vals[{rs1}] | vals[{rs2}]')
+    def instruction_or(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = vals[ins.rs1] | vals[ins.rs2]
+
+    @jit_template('vals[{rd}] = (vals[{rs1}] | {imm}) & 0xFFFFFFFF')
+    def instruction_ori(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = (vals[ins.rs1] | ins.imm) & 0xFFFFFFFF
+
+    @jit_template('vals[{rd}] = vals[{rs1}] & vals[{rs2}]')
+    def instruction_and(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = vals[ins.rs1] & vals[ins.rs2]
+
+    @jit_template('vals[{rd}] = (vals[{rs1}] & {imm}) & 0xFFFFFFFF')
+    def instruction_andi(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = (vals[ins.rs1] & ins.imm) & 0xFFFFFFFF
+
+    @jit_template('vals[{rd}] = int((vals[{rs1}] ^ 0x80000000) < (vals[{rs2}] ^ 0x80000000))')
+    def instruction_slt(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        # flipping the sign bit maps signed order onto unsigned order
+        vals[ins.rd] = int((vals[ins.rs1] ^ 0x80000000) < (vals[ins.rs2] ^ 0x80000000))
+
+    @jit_template('vals[{rd}] = int(((vals[{rs1}] ^ 0x80000000) - 0x80000000) < {imm})')
+    def instruction_slti(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = int(((vals[ins.rs1] ^ 0x80000000) - 0x80000000) < ins.imm)
+
+    @jit_template('vals[{rd}] = int(vals[{rs1}] < vals[{rs2}])')
+    def instruction_sltu(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = int(vals[ins.rs1] < vals[ins.rs2])
+
+    @jit_template('vals[{rd}] = int(vals[{rs1}] < {imm})')
+    def instruction_sltiu(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = int(vals[ins.rs1] < ins.imm)
+
+    # branch handlers assign self.cpu.pc directly, as going through the pc property costs an extra call per branch
+    @jit_template('if vals[{rs1}] == vals[{rs2}]:\n    cpu.pc = {imm}')
+    def instruction_beq(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if vals[ins.rs1] == vals[ins.rs2]:
+            self.cpu.pc = ins.imm
+
+    @jit_template('if vals[{rs1}] != vals[{rs2}]:\n    cpu.pc = {imm}')
+    def instruction_bne(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if vals[ins.rs1] != vals[ins.rs2]:
+            self.cpu.pc = ins.imm
+
+    @jit_template('if (vals[{rs1}] ^ 0x80000000) < (vals[{rs2}] ^ 0x80000000):\n    cpu.pc = {imm}')
+    def instruction_blt(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if (vals[ins.rs1] ^ 0x80000000) < (vals[ins.rs2] ^ 0x80000000):
+            self.cpu.pc = ins.imm
+
+    @jit_template('if (vals[{rs1}] ^ 0x80000000) >= (vals[{rs2}] ^ 0x80000000):\n    cpu.pc = {imm}')
+    def instruction_bge(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if (vals[ins.rs1] ^ 0x80000000) >= (vals[ins.rs2] ^ 0x80000000):
+            self.cpu.pc = ins.imm
+
+    @jit_template('if vals[{rs1}] < vals[{rs2}]:\n    cpu.pc = {imm}')
+    def instruction_bltu(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if vals[ins.rs1] < vals[ins.rs2]:
+            self.cpu.pc = ins.imm
+
+    @jit_template('if vals[{rs1}] >= vals[{rs2}]:\n    cpu.pc = {imm}')
+    def instruction_bgeu(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if vals[ins.rs1] >= vals[ins.rs2]:
+            self.cpu.pc = ins.imm
 
     # technically deprecated
-    def instruction_j(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 1)
-        addr = ins.get_imm(0)
-        self.pc = addr
-
-    def instruction_jal(self, ins: 'Instruction'):
-        reg = 'ra'  # default register is ra
-        if len(ins.args) == 1:
-            addr = ins.get_imm(0)
-        else:
-            ASSERT_LEN(ins.args, 2)
-            reg = ins.get_reg(0)
-            addr = ins.get_imm(1)
-        self.regs.set(reg, Int32(self.pc))
-        self.pc = addr
+    @jit_template('cpu.pc = {imm}')
+    def instruction_j(self, ins: 'DecodedInstruction'):
+        self.cpu.pc = ins.imm
+
+    @jit_template('vals[{rd}] = {pc}\ncpu.pc = {imm}')
+    def instruction_jal(self, ins: 'DecodedInstruction'):
+        cpu = self.cpu
+        self.vals[ins.rd] = cpu.pc
+        cpu.pc = ins.imm
 
     # zero pseudo-ops:
     #beqz, bnez, bltz, bgez, bgtz, blez
 
-    def instruction_beqz(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 2)
-        rs1 = ins.get_reg(0)
-        dst = ins.get_imm(1)
-        if Int32(self.regs.get(rs1)) == 0:
-            self.pc = dst
-
-    def instruction_bnez(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 2)
-        rs1 = ins.get_reg(0)
-        dst = ins.get_imm(1)
-        if Int32(self.regs.get(rs1)) != 0:
-            self.pc = dst
-
-    def instruction_bltz(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 2)
-        rs1 = ins.get_reg(0)
-        dst = ins.get_imm(1)
-        if Int32(self.regs.get(rs1)) < 0:
-            self.pc = dst
-
-    def instruction_bgtz(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 2)
-        rs1 = ins.get_reg(0)
-        dst = ins.get_imm(1)
-        if Int32(self.regs.get(rs1)) > 0:
-            self.pc = dst
-
-    def instruction_bgez(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 2)
-        rs1 = ins.get_reg(0)
-        dst = ins.get_imm(1)
-        if Int32(self.regs.get(rs1)) >= 0:
-            self.pc = dst
-
-    def instruction_blez(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 2)
-        rs1 = ins.get_reg(0)
-        dst = ins.get_imm(1)
-        if Int32(self.regs.get(rs1)) <= 0:
-            self.pc = dst
+    @jit_template('if vals[{rs1}] == 0:\n    cpu.pc = {imm}')
+    def instruction_beqz(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if vals[ins.rs1] == 0:
+            self.cpu.pc = ins.imm
+
+    @jit_template('if vals[{rs1}] != 0:\n    cpu.pc = {imm}')
+    def instruction_bnez(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if vals[ins.rs1] != 0:
+            self.cpu.pc = ins.imm
+
+    @jit_template('if vals[{rs1}] >= 0x80000000:\n    cpu.pc = {imm}')
+    def instruction_bltz(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if vals[ins.rs1] >= 0x80000000:
+            self.cpu.pc = ins.imm
+
+    @jit_template('if 0 < vals[{rs1}] < 0x80000000:\n    cpu.pc = {imm}')
+    def instruction_bgtz(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if 0 < vals[ins.rs1] < 0x80000000:
+            self.cpu.pc = ins.imm
+
+    @jit_template('if vals[{rs1}] < 0x80000000:\n    cpu.pc = {imm}')
+    def instruction_bgez(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if vals[ins.rs1] < 0x80000000:
+            self.cpu.pc = ins.imm
+
+    @jit_template('if not 0 < vals[{rs1}] < 0x80000000:\n    cpu.pc = {imm}')
+    def instruction_blez(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if not 0 < vals[ins.rs1] < 0x80000000:
+            self.cpu.pc = ins.imm
 
     #pseudo instructions bgt ble bgtu bleu
 
-    def instruction_bgt(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rs1, rs2, dst = self.parse_rs_rs_imm(ins)
-        if rs1 > rs2:
-            self.pc = dst.unsigned_value
-
-    def instruction_ble(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rs1, rs2, dst = self.parse_rs_rs_imm(ins)
-        if rs1 <= rs2:
-            self.pc = dst.unsigned_value
-
-    def instruction_bgtu(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rs1, rs2, dst = self.parse_rs_rs_imm(ins, signed=False)
-        if rs1 > rs2:
-            self.pc = dst.unsigned_value
-
-    def instruction_bleu(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rs1, rs2, dst = self.parse_rs_rs_imm(ins, signed=False)
-        if rs1 <= rs2:
-            self.pc = dst.unsigned_value
+    @jit_template('if (vals[{rs1}] ^ 0x80000000) > (vals[{rs2}] ^ 0x80000000):\n    cpu.pc = {imm}')
+    def instruction_bgt(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if (vals[ins.rs1] ^ 0x80000000) > (vals[ins.rs2] ^ 0x80000000):
+            self.cpu.pc = ins.imm
+
+    @jit_template('if (vals[{rs1}] ^ 0x80000000) <= (vals[{rs2}] ^ 0x80000000):\n    cpu.pc = {imm}')
+    def instruction_ble(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if (vals[ins.rs1] ^ 0x80000000) <= (vals[ins.rs2] ^ 0x80000000):
+            self.cpu.pc = ins.imm
+
+    @jit_template('if vals[{rs1}] > vals[{rs2}]:\n    cpu.pc = {imm}')
+    def instruction_bgtu(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if vals[ins.rs1] > vals[ins.rs2]:
+            self.cpu.pc = ins.imm
+
+    @jit_template('if vals[{rs1}] <= vals[{rs2}]:\n    cpu.pc = {imm}')
+    def instruction_bleu(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if vals[ins.rs1] <= vals[ins.rs2]:
+            self.cpu.pc = ins.imm
 
     #jds pseudo-op
-    def instruction_call(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 1)
-        addr = ins.get_imm(0)
-        self.regs.set('ra', Int32(self.pc))
-        self.pc = addr
+    @jit_template('vals[1] = {pc}\ncpu.pc = {imm}')
+    def instruction_call(self, ins: 'DecodedInstruction'):
+        cpu = self.cpu
+        self.vals[1] = cpu.pc
+        cpu.pc = ins.imm
 
     #jds pseudo-op
-    def instruction_jr(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 1)
-        reg = ins.get_reg(0)
-        val = self.regs.get(reg)
-        thing = val&(0xFFFFFFFE)
-        #self.regs.set(reg, self.pc)
-        self.pc = thing
+    @jit_template('cpu.pc = vals[{rs1}] & 0xFFFFFFFE')
+    def instruction_jr(self, ins: 'DecodedInstruction'):
+        self.cpu.pc = self.vals[ins.rs1] & 0xFFFFFFFE
 
     #modified by jds
-    def instruction_jalr(self, ins: 'Instruction'):
-        reg = 'ra'  # default register is ra
-        if len(ins.args) == 1:
-            addr = ins.get_reg(0)
-            thing = self.regs.get(addr)
-            addr = thing #&(0xFFFFFFFE)
-        else:
-            #ASSERT_LEN(ins.args, 2)
-            reg, addr = self.parse_mem_ins(ins)
-            #reg = ins.get_reg(0)
-            #addr = ins.get_imm(1)
-            #thing = self.regs.get(addr)
-            #addr = addr&(0xFFFFFFFE)
-            #reg = ins.get_reg(0)
-            #addr = ins.get_imm(1)
-        self.regs.set(reg, Int32(self.pc))
-        self.pc = addr
-
-    '''
-    def instruction_jalr(self, ins: 'Instruction'):
-        print(ins.args)
-        ASSERT_LEN(ins.args, 2)
-        reg = ins.get_reg(0)
-        addr = ins.get_imm(1)
-        self.regs.set(reg, Int32(self.pc))
-        self.pc = addr
-    '''
-
-    def instruction_ret(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 0)
-        self.pc = self.regs.get('ra').value
-
-    def instruction_ecall(self, ins: 'Instruction'):
+    @jit_template('cpu.pc = (vals[{rs1}] + {imm}) & 0xFFFFFFFF\nvals[{rd}] = {pc}')
+    def instruction_jalr(self, ins: 'DecodedInstruction'):
+        cpu = self.cpu
+        vals = self.vals
+        # compute the target first, rd may be the same register as rs1
+        addr = (vals[ins.rs1] + ins.imm) & 0xFFFFFFFF
+        vals[ins.rd] = cpu.pc
+        cpu.pc = addr
+
+    @jit_template('cpu.pc = vals[1]')
+    def instruction_ret(self, ins: 'DecodedInstruction'):
+        self.cpu.pc = self.vals[1]
+
+    def instruction_ecall(self, ins: 'DecodedInstruction'):
         self.instruction_scall(ins)
 
-    def instruction_ebreak(self, ins: 'Instruction'):
+    def instruction_ebreak(self, ins: 'DecodedInstruction'):
         self.instruction_sbreak(ins)
 
-    def instruction_scall(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 0)
-
-        if not isinstance(self.cpu, UserModeCPU):
+    def instruction_scall(self, ins: 'DecodedInstruction'):
+        if not self._is_user_mode:
             # FIXME: add exception for syscall not supported or something
             raise
 
         syscall = Syscall(self.regs.get('utilreg'), self.cpu)
         self.cpu.syscall_int.handle_syscall(syscall)
 
-    def instruction_sbreak(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 0)
-
+    def instruction_sbreak(self, ins: 'DecodedInstruction'):
         print(FMT_DEBUG + "Debug instruction encountered at 0x{:08X}".format(self.pc - 1) + FMT_NONE)
         raise LaunchDebuggerException()
 
-    def instruction_nop(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 0)
+    @jit_template('pass')
+    def instruction_nop(self, ins: 'DecodedInstruction'):
         pass
 
-    def instruction_li(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 2)
-        reg = ins.get_reg(0)
-        immediate = ins.get_imm(1)
-        self.regs.set(reg, Int32(immediate))
-
-    def instruction_la(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 2)
-        reg = ins.get_reg(0)
-        immediate = ins.get_imm(1)
-        self.regs.set(reg, Int32(immediate))
-
-    def instruction_mv(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 2)
-        rd, rs = ins.get_reg(0), ins.get_reg(1)
-        self.regs.set(rd, self.regs.get(rs))
-
-    def instruction_neg(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 2)
-        rd, rs = ins.get_reg(0), ins.get_reg(1)
-        self.regs.set(rd, Int32(0)-self.regs.get(rs))
-
-    def instruction_not(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 2)
-        rd, rs = ins.get_reg(0), ins.get_reg(1)
-        self.regs.set(rd, Int32(-1) ^ self.regs.get(rs))
+    @jit_template('vals[{rd}] = {imm} & 0xFFFFFFFF')
+    def instruction_li(self, ins: 'DecodedInstruction'):
+        self.vals[ins.rd] = ins.imm & 0xFFFFFFFF
+
+    @jit_template('vals[{rd}] = {imm} & 0xFFFFFFFF')
+    def instruction_la(self, ins: 'DecodedInstruction'):
+        self.vals[ins.rd] = ins.imm & 0xFFFFFFFF
+
+    @jit_template('vals[{rd}] = vals[{rs1}]')
+    def instruction_mv(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = vals[ins.rs1]
+
+    @jit_template('vals[{rd}] = -vals[{rs1}] & 0xFFFFFFFF')
+    def instruction_neg(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = -vals[ins.rs1] & 0xFFFFFFFF
+
+    @jit_template('vals[{rd}] = vals[{rs1}] ^ 0xFFFFFFFF')
+    def instruction_not(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        vals[ins.rd] = vals[ins.rs1] ^ 0xFFFFFFFF
 
     # Add instructions to start/stop state saving for catsoop debug
-    def instruction_startlog(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 0)
+    @jit_template('pass')
+    def instruction_startlog(self, ins: 'DecodedInstruction'):
         pass # nop
-    
-    def instruction_stoplog(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 0)
+
+    @jit_template('pass')
+    def instruction_stoplog(self, ins: 'DecodedInstruction'):
         pass # nop
 
     # Add instruction for catsoop debug breakpoint
-    def instruction_csbreak(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 0)
-        pass # stuff happens on the js side
\ No newline at end of file
+    @jit_template('pass')
+    def instruction_csbreak(self, ins: 'DecodedInstruction'):
+        pass # stuff happens on the js side
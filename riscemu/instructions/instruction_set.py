@@ -4,13 +4,14 @@ RiscEmu (c) 2021 Anton Lydike
 SPDX-License-Identifier: MIT
 """
 
-from typing import Tuple, Callable, Dict
+from typing import Tuple, Callable, Dict, Union, Optional, FrozenSet
 
 from abc import ABC
 from ..CPU import CPU
+from ..MMU import MEM_STRUCTS
+from ..registers import Registers
 from riscemu.types.exceptions import ASSERT_LEN, ASSERT_IN, ASSERT_IMM_LEN, ASSERT_WORD_ALIGNED
-from ..types import Instruction, Int32, UInt32
-
+from ..types import Instruction, DecodedInstruction, Int32, UInt32
 
 class InstructionSet(ABC):
     """
@@ -23,12 +24,59 @@ class InstructionSet(ABC):
     instructions containing a dot '.' should replace it with an underscore.
     """
 
+    operand_formats: Dict[str, Union[Tuple[str, ...], Dict[int, Tuple[str, ...]]]] = dict()
+    """
+    Maps instruction names to the meaning of each of their arguments, e.g. ('rd', 'rs1', 'rs2'). Instructions with
+    several forms map to a dict from the number of arguments to the format of that form.
+
+    Instructions listed here are decoded into a DecodedInstruction before they are executed, see :meth:`decode`.
+    Valid fields are the registers rd, rs1 and rs2, and the immediates:
+
+     - imm: the plain immediate value
+     - simm12: a signed 12 bit immediate, sign extended
+     - uimm12: a 12 bit immediate which is range checked as unsigned, but still sign extended
+     - uimm20: an unsigned 20 bit immediate
+     - shamt: a shift amount, only the lowest 5 bits are kept
+     - target12: a branch target, checked and sign extended like simm12, as an unsigned address
+
+    The field csr holds the address of a control and status register, which is stored in the csr attribute.
+    """
+
+    control_flow_instructions: FrozenSet[str] = frozenset()
+    """
+    Instructions which may change the pc, halt the CPU or launch the debugger. A basic block ends after them.
+
+    Instructions which are not decoded (see :attr:`operand_formats`) always end a basic block, as nothing is known
+    about what they do.
+    """
+
+    handler_functions: Dict[str, Callable[['InstructionSet', 'Instruction'], None]] = dict()
+    """
+    Maps instruction names to the (unbound) methods implementing them, collected once per class
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.handler_functions = {
+            member[12:].replace('_', '.'): getattr(cls, member)
+            for member in dir(cls) if member.startswith('instruction_')
+        }
+
     def __init__(self, cpu: 'CPU'):
         """Create a new instance of the Instruction set. This requires access to a CPU, and grabs vertain things
         from it such as access to the MMU and registers.
         """
         self.name = self.__class__.__name__
         self.cpu = cpu
+        # registers and mmu never change for a cpu, so bind them directly instead of going through self.cpu
+        self.regs = cpu.regs
+        self.mmu = cpu.mmu
+        # the raw register file, handlers of decoded instructions index it directly
+        self.vals = cpu.regs.vals
+        # bind all handlers once, so dispatching an instruction is a single dict lookup
+        self.handlers: Dict[str, Callable[['Instruction'], None]] = {
+            name: func.__get__(self) for name, func in self.handler_functions.items()
+        }
 
     def load(self) -> Dict[str, Callable[['Instruction'], None]]:
         """
@@ -37,9 +85,109 @@ class InstructionSet(ABC):
         It returns a dictionary of all instructions in this instruction set,
         pointing to the correct handler for it
         """
-        return {
-            name: ins for name, ins in self.get_instructions()
-        }
+        return dict(self.handlers)
+
+    def decode(self, ins: 'Instruction') -> 'Instruction':
+        """
+        Resolve the operands of ins once, so its handler doesn't have to parse them every time it is executed
+
+        Instructions without an entry in :attr:`operand_formats` are returned unchanged.
+        """
+        fmt = self.operand_formats.get(ins.name)
+        if fmt is None:
+            return ins
+        if isinstance(fmt, dict):
+            ASSERT_IN(len(ins.args), fmt)
+            fmt = fmt[len(ins.args)]
+        ASSERT_LEN(ins.args, len(fmt))
+        decoded = DecodedInstruction(ins)
+        # rd is resolved last, so errors are reported in the same order as they would be during execution
+        for i, field in sorted(enumerate(fmt), key=lambda arg: arg[1] == 'rd'):
+            if field == 'rd':
+                decoded.rd = Registers.write_index(ins.get_reg(i))
+            elif field in ('rs1', 'rs2'):
+                setattr(decoded, field, Registers.read_index(ins.get_reg(i)))
+            elif field == 'csr':
+                decoded.csr = ins.get_imm(i)
+            else:
+                decoded.imm = self.decode_imm(ins.get_imm(i), field)
+        return self.specialize(decoded)
+
+    def specialize(self, ins: 'DecodedInstruction') -> 'DecodedInstruction':
+        """
+        Replace a decoded instruction by an equivalent, cheaper one of this instruction set, by changing its name and
+        operands. The handler is looked up by the new name.
+
+        By default, instructions are left unchanged.
+        """
+        return ins
+
+    def fuse(self, first: 'DecodedInstruction', second: 'DecodedInstruction', pc: int) \
+            -> Optional[Tuple['DecodedInstruction', 'DecodedInstruction']]:
+        """
+        Replace two consecutive instructions in a basic block by a cheaper pair with the same combined effect, e.g. by
+        computing the result of both in the first one, and replacing the second one by a nop.
+
+        Blocks are only entered at their start, so the state in between both instructions is never observed. The
+        instructions themselves must not be modified, as they are shared with other blocks.
+
+        By default, no instructions are fused.
+
+        :param pc: The value of the pc while first is executed
+        :return: The replacement for first and second, or None if they can't be fused
+        """
+        return None
+
+    @staticmethod
+    def decode_imm(imm: int, field: str) -> int:
+        """
+        Range check and normalize an immediate according to its field type (see :attr:`operand_formats`)
+        """
+        if field == 'imm':
+            return imm
+        if field == 'shamt':
+            return imm & 0b11111
+        if field == 'uimm20':
+            ASSERT_IMM_LEN(imm, 20, False)
+            return imm
+        ASSERT_IMM_LEN(imm, 12, field == 'simm12')
+        imm = imm & 0xFFF
+        if imm > 2047:
+            imm = -(4096 - imm)
+        if field in ('uimm12', 'target12'):
+            return imm & 0xFFFFFFFF
+        return imm
+
+    def read_mem(self, ins: 'DecodedInstruction', addr: int, size: int) -> int:
+        """
+        Read size bytes at addr as an unsigned little-endian integer
+
+        The accessed section is remembered in ins, so following executions of ins accessing the same section can read
+        its data directly, instead of going through the MMU
+        """
+        sec = ins.mem_sec
+        if sec is not None:
+            offset = addr - sec.base
+            if 0 <= offset <= sec.size - size:
+                return MEM_STRUCTS[size].unpack_from(sec.data, offset)[0]
+        val = self.mmu.read_uint(addr, size)
+        ins.mem_sec = self.mmu.get_direct_access_sec(addr)
+        return val
+
+    def write_mem(self, ins: 'DecodedInstruction', addr: int, size: int, val: int):
+        """
+        Write the lowest size bytes of val to addr, little-endian
+
+        Like :meth:`read_mem`, the accessed section is remembered in ins.
+        """
+        sec = ins.mem_sec
+        if sec is not None:
+            offset = addr - sec.base
+            if 0 <= offset <= sec.size - size:
+                MEM_STRUCTS[size].pack_into(sec.data, offset, val & (0xFFFFFFFF >> (32 - 8 * size)))
+                return
+        self.mmu.write(addr, size, val)
+        ins.mem_sec = self.mmu.get_direct_access_sec(addr)
 
     def get_instructions(self):
         """
@@ -47,9 +195,8 @@ class InstructionSet(ABC):
 
         converts underscores in names to dots
         """
-        for member in dir(self):
-            if member.startswith('instruction_'):
-                yield member[12:].replace('_', '.'), getattr(self, member)
+        for name, func in self.handler_functions.items():
+            yield name, func.__get__(self)
 
     def parse_mem_ins(self, ins: 'Instruction') -> Tuple[str, Int32]:
         """
@@ -139,16 +286,8 @@ class InstructionSet(ABC):
     def pc(self, val):
         self.cpu.pc = val
 
-    @property
-    def mmu(self):
-        return self.cpu.mmu
-
-    @property
-    def regs(self):
-        return self.cpu.regs
-
     def __repr__(self):
         return "InstructionSet[{}] with {} instructions".format(
             self.__class__.__name__,
-            len(list(self.get_instructions()))
+            len(self.handlers)
         )
@@ -0,0 +1,114 @@
+"""
+RiscEmu (c) 2021-2022 Anton Lydike
+
+SPDX-License-Identifier: MIT
+
+This file contains a simple JIT compiler, which translates hot basic blocks into Python functions. Instruction
+handlers can provide the Python source of their effect using the jit_template decorator. These templates are inlined
+into a single function per basic block, which is compiled at runtime. Instructions without a template are executed by
+calling their handler from the compiled function.
+"""
+
+import typing
+from textwrap import indent
+from typing import Callable, List, Tuple, Dict
+
+from .types import Instruction, DecodedInstruction
+
+if typing.TYPE_CHECKING:
+    from .types import CPU
+
+
+def jit_template(source: str, **bindings):
+    """
+    Attach source to an instruction handler: a Python statement with the same effect as the handler.
+
+    The source is formatted with the fields of the DecodedInstruction (rd, rs1, rs2 and imm), and pc, the address of
+    the instruction following it. It is executed with the raw register file bound to vals and the CPU bound to cpu.
+    Any further objects the source needs can be passed as keyword arguments, they are bound to their name.
+
+    Templates must not raise exceptions, as the pc and cycle of the CPU are only brought up to date right before
+    calling a handler without a template, and at the end of the block. Templates can handle uncommon cases by
+    executing {fallback}, a statement calling the handler itself with the pc and cycle up to date, which returns from
+    the block if the handler halted the CPU or changed the pc. It must be placed on a line of its own. The instruction
+    passed to the handler is bound to the name {ins}.
+    """
+
+    def decorator(handler):
+        handler.jit_template = source
+        handler.jit_bindings = bindings
+        return handler
+
+    return decorator
+
+
+def compile_block(cpu: 'CPU', addr: int, block: List[Tuple[Callable[[Instruction], None], Instruction]],
+                  compiled_blocks: Dict[int, Callable[[bool], None]]) -> Callable[[bool], None]:
+    """
+    Translate the basic block starting at addr into a single Python function
+
+    :param cpu: The CPU executing the block
+    :param addr: The address of the first instruction in the block
+    :param block: The handlers and decoded instructions in the block, as built by the CPU
+    :param compiled_blocks: The compiled blocks of the cpu, which are dropped when the code changes
+    :return: A function executing the whole block, including updating the cpu's pc and cycle. If it is called with
+             loop=True, it keeps executing the block as long as it jumps back to its own start, and is still compiled.
+    """
+    params = ['loop=True', 'cpu=cpu', 'vals=vals', 'compiled_blocks=compiled_blocks']
+    namespace = {'cpu': cpu, 'vals': cpu.regs.vals, 'compiled_blocks': compiled_blocks}
+    lines = []
+    # number of instructions executed since the cpu's pc and cycle were last updated
+    pending = 0
+
+    def sync(next_pc: int):
+        nonlocal pending
+        lines.append('cpu.cycle += {}'.format(pending))
+        lines.append('cpu.pc = {}'.format(next_pc))
+        pending = 0
+
+    for i, (handler, ins) in enumerate(block):
+        next_pc = addr + (i + 1) * cpu.INS_XLEN
+        pending += 1
+        template = getattr(handler, 'jit_template', None)
+        if not isinstance(ins, DecodedInstruction):
+            template = None
+        if i == len(block) - 1:
+            # the last instruction may jump, so the fallthrough pc has to be set before
+            sync(next_pc)
+        if template is None or '{fallback}' in template or '{ins}' in template:
+            namespace['h{}'.format(i)] = handler
+            namespace['i{}'.format(i)] = ins
+            params += ['h{0}=h{0}'.format(i), 'i{0}=i{0}'.format(i)]
+        # a handler halting the cpu or jumping in the middle of the block ends it early, the last instruction is
+        # handled by the loop condition below
+        check = '' if i == len(block) - 1 else '\nif cpu.halted or cpu.pc != {}:\n    return'.format(next_pc)
+        if template is None:
+            if pending:
+                sync(next_pc)
+            lines.append('h{0}(i{0}){1}'.format(i, check))
+        else:
+            for name, obj in handler.jit_bindings.items():
+                if name not in namespace:
+                    namespace[name] = obj
+                    params.append('{0}={0}'.format(name))
+            # the fallback leaves the cycle as it was, it is updated for all pending instructions at the next sync
+            fallback = 'h{0}(i{0})'.format(i)
+            if pending:
+                fallback = 'cpu.cycle += {0}; cpu.pc = {1}; {2}{3}\ncpu.cycle -= {0}'.format(
+                    pending, next_pc, fallback, check
+                )
+            else:
+                fallback += check
+            if '{fallback}' in template:
+                # continue the fallback at the indentation of its placeholder
+                prefix = template[:template.index('{fallback}')].rsplit('\n', 1)[-1]
+                fallback = fallback.replace('\n', '\n' + prefix)
+            lines.append(template.format(
+                rd=ins.rd, rs1=ins.rs1, rs2=ins.rs2, imm=ins.imm, pc=next_pc, ins='i{}'.format(i), fallback=fallback
+            ))
+
+    # loops consisting of a single block are run without returning to the cpu after every iteration
+    lines.append('if not loop or cpu.halted or cpu.pc != {0} or {0} not in compiled_blocks:\n    return'.format(addr))
+    source = 'def block({}):\n    while True:\n{}\n'.format(', '.join(params), indent('\n'.join(lines), '        '))
+    exec(compile(source, '<jit block 0x{:08X}>'.format(addr), 'exec'), namespace)
+    return namespace['block']
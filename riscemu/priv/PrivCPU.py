@@ -62,6 +62,10 @@ class PrivCPU(CPU):
         # performance counters
         self._perf_counters = list()
 
+        # maps the address of each executed instruction to the decoded instruction
+        self._decode_cache: Dict[T_AbsoluteAddress, Instruction] = dict()
+        self.mmu.code_write_listeners.append(self._invalidate_decode_cache)
+
         # add TextIO
         io = TextIO(0xFF0000, 64)
         self.mmu.load_section(io, True)
@@ -158,10 +162,12 @@ class PrivCPU(CPU):
             if self.cycle % 20 == 0:
                 self._timer_step()
             self._check_interrupt()
-            ins = self.mmu.read_ins(self.pc)
+            ins = self._decode_cache.get(self.pc)
+            if ins is None:
+                ins = self._decode_cache[self.pc] = self.decode_instruction(self.mmu.read_ins(self.pc))
             if verbose and (self.mode == PrivModes.USER or self.conf.verbosity > 4):
                 print(FMT_CPU + "   Running 0x{:08X}:{} {}".format(self.pc, FMT_NONE, ins))
-            self.run_instruction(ins)
+            self.instructions[ins.name](ins)
             self.pc += self.INS_XLEN
         except CpuTrap as trap:
             print("EXCEPT")
@@ -177,6 +183,13 @@ class PrivCPU(CPU):
                     raise LaunchDebuggerException()
             self.pc += self.INS_XLEN
 
+    def _invalidate_decode_cache(self, addr: T_AbsoluteAddress, size: int):
+        """
+        Drop all cached instructions overlapping the memory region [addr, addr + size)
+        """
+        for ins_addr in range(addr - (addr % self.INS_XLEN), addr + size, self.INS_XLEN):
+            self._decode_cache.pop(ins_addr, None)
+
     def _timer_step(self):
         if not self._time_interrupt_enabled:
             return
@@ -21,28 +21,50 @@ class PrivRV32I(RV32I):
     This is an extension of RV32I, written for the PrivCPU class
     """
 
-    def instruction_csrrw(self, ins: 'Instruction'):
-        rd, rs, csr_addr = self.parse_crs_ins(ins)
+    # branches and jumps are pc-relative here, so they are not decoded into absolute targets like in RV32I
+    operand_formats = {
+        **{
+            name: fmt for name, fmt in RV32I.operand_formats.items()
+            if name not in ('beq', 'bne', 'blt', 'bge', 'bltu', 'bgeu', 'j', 'jal', 'jalr')
+        },
+        # branch offsets are decoded, but stay relative to the pc
+        **dict.fromkeys(('beq', 'bne', 'blt', 'bge'), ('rs1', 'rs2', 'simm12')),
+        **dict.fromkeys(('bltu', 'bgeu'), ('rs1', 'rs2', 'uimm12')),
+        # jumps only have their long forms
+        'jal': ('rd', 'imm'),
+        'jalr': ('rd', 'rs1', 'simm12'),
+        **dict.fromkeys(('csrrw', 'csrrs'), ('rd', 'rs1', 'csr')),
+        'csrrwi': ('rd', 'imm', 'csr'),
+    }
+
+    def specialize(self, ins: 'DecodedInstruction') -> 'DecodedInstruction':
+        """
+        RV32I replaces branches comparing against zero by beqz and friends, and jal x0 by j, which jump to absolute
+        targets. Branches and jumps are pc-relative here, so they are left unchanged.
+        """
+        if ins.name in ('beq', 'bne', 'blt', 'bge', 'jal', 'jalr'):
+            return ins
+        return super().specialize(ins)
+
+    def instruction_csrrw(self, ins: 'DecodedInstruction'):
+        csr = self.cpu.csr
         old_val = None
-        if rd != 'zero':
-            self.cpu.csr.assert_can_read(self.cpu.mode, csr_addr)
-            old_val = self.cpu.csr.get(csr_addr)
-        if rs != 'zero':
-            new_val = self.regs.get(rs)
-            self.cpu.csr.assert_can_write(self.cpu.mode, csr_addr)
-            self.cpu.csr.set(csr_addr, new_val)
+        if ins.rd != Registers.ZERO_SINK:
+            csr.assert_can_read(self.cpu.mode, ins.csr)
+            old_val = csr.get(ins.csr)
+        if ins.rs1 != 0:
+            csr.assert_can_write(self.cpu.mode, ins.csr)
+            csr.set(ins.csr, self.vals[ins.rs1])
         if old_val is not None:
-            self.regs.set(rd, old_val)
+            self.vals[ins.rd] = old_val.unsigned_value
 
-    def instruction_csrrs(self, ins: 'Instruction'):
-        rd, rs, csr_addr = self.parse_crs_ins(ins)
-        if rs != 'zero':
+    def instruction_csrrs(self, ins: 'DecodedInstruction'):
+        if ins.rs1 != 0:
             # oh no, this should not happen!
             INS_NOT_IMPLEMENTED(ins)
-        if rd != 'zero':
-            self.cpu.csr.assert_can_read(self.cpu.mode, csr_addr)
-            old_val = self.cpu.csr.get(csr_addr)
-            self.regs.set(rd, old_val)
+        if ins.rd != Registers.ZERO_SINK:
+            self.cpu.csr.assert_can_read(self.cpu.mode, ins.csr)
+            self.vals[ins.rd] = self.cpu.csr.get(ins.csr).unsigned_value
 
     def instruction_csrrc(self, ins: 'Instruction'):
         INS_NOT_IMPLEMENTED(ins)
@@ -50,15 +72,13 @@ class PrivRV32I(RV32I):
     def instruction_csrrsi(self, ins: 'Instruction'):
         INS_NOT_IMPLEMENTED(ins)
 
-    def instruction_csrrwi(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rd, imm, addr = ins.get_reg(0), ins.get_imm(1), ins.get_imm(2)
-        if rd != 'zero':
-            self.cpu.csr.assert_can_read(self.cpu.mode, addr)
-            old_val = self.cpu.csr.get(addr)
-            self.regs.set(rd, old_val)
-        self.cpu.csr.assert_can_write(self.cpu.mode, addr)
-        self.cpu.csr.set(addr, imm)
+    def instruction_csrrwi(self, ins: 'DecodedInstruction'):
+        csr = self.cpu.csr
+        if ins.rd != Registers.ZERO_SINK:
+            csr.assert_can_read(self.cpu.mode, ins.csr)
+            self.vals[ins.rd] = csr.get(ins.csr).unsigned_value
+        csr.assert_can_write(self.cpu.mode, ins.csr)
+        csr.set(ins.csr, ins.imm)
 
     def instruction_csrrci(self, ins: 'Instruction'):
         INS_NOT_IMPLEMENTED(ins)
@@ -100,45 +120,43 @@ class PrivRV32I(RV32I):
         """
         raise EcallTrap(self.cpu.mode)
 
-    def instruction_beq(self, ins: 'Instruction'):
-        rs1, rs2, dst = self.parse_rs_rs_imm(ins)
-        if rs1 == rs2:
-            self.pc += dst.value - 4
+    def instruction_beq(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if vals[ins.rs1] == vals[ins.rs2]:
+            self.cpu.pc += ins.imm - 4
 
-    def instruction_bne(self, ins: 'Instruction'):
-        rs1, rs2, dst = self.parse_rs_rs_imm(ins)
-        if rs1 != rs2:
-            self.pc += dst.value - 4
+    def instruction_bne(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if vals[ins.rs1] != vals[ins.rs2]:
+            self.cpu.pc += ins.imm - 4
 
-    def instruction_blt(self, ins: 'Instruction'):
-        rs1, rs2, dst = self.parse_rs_rs_imm(ins)
-        if rs1 < rs2:
-            self.pc += dst.value - 4
+    def instruction_blt(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if (vals[ins.rs1] ^ 0x80000000) < (vals[ins.rs2] ^ 0x80000000):
+            self.cpu.pc += ins.imm - 4
 
-    def instruction_bge(self, ins: 'Instruction'):
-        rs1, rs2, dst = self.parse_rs_rs_imm(ins)
-        if rs1 >= rs2:
-            self.pc += dst.value - 4
+    def instruction_bge(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if (vals[ins.rs1] ^ 0x80000000) >= (vals[ins.rs2] ^ 0x80000000):
+            self.cpu.pc += ins.imm - 4
 
-    def instruction_bltu(self, ins: 'Instruction'):
-        rs1, rs2, dst = self.parse_rs_rs_imm(ins, signed=False)
-        if rs1 < rs2:
-            self.pc += dst.value - 4
+    def instruction_bltu(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if vals[ins.rs1] < vals[ins.rs2]:
+            self.cpu.pc += ins.imm - 4
 
-    def instruction_bgeu(self, ins: 'Instruction'):
-        rs1, rs2, dst = self.parse_rs_rs_imm(ins, signed=False)
-        if rs1 >= rs2:
-            self.pc += dst.value - 4
+    def instruction_bgeu(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        if vals[ins.rs1] >= vals[ins.rs2]:
+            self.cpu.pc += ins.imm - 4
 
     # technically deprecated
     def instruction_j(self, ins: 'Instruction'):
         raise NotImplementedError("Should never be reached!")
 
-    def instruction_jal(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 2)
-        reg = ins.get_reg(0)
-        addr = ins.get_imm(1)
-        if reg == 'ra' and (
+    def instruction_jal(self, ins: 'DecodedInstruction'):
+        addr = ins.imm
+        if ins.rd == REGISTER_INDICES['ra'] and (
                 (self.cpu.mode == PrivModes.USER and self.cpu.conf.verbosity > 1) or
                 (self.cpu.conf.verbosity > 3)
         ):
@@ -148,24 +166,15 @@ class PrivRV32I(RV32I):
                 self.pc + addr
             ) + FMT_NONE)
             self.regs.dump_reg_a()
-        self.regs.set(reg, Int32(self.pc))
+        self.vals[ins.rd] = self.pc & 0xFFFFFFFF
         self.pc += addr - 4
 
-    def instruction_jalr(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        rd, rs, imm = self.parse_rd_rs_imm(ins)
-        self.regs.set(rd, Int32(self.pc))
-        self.pc = rs.value + imm.value - 4
+    def instruction_jalr(self, ins: 'DecodedInstruction'):
+        vals = self.vals
+        # compute the target first, rd may be the same register as rs1
+        addr = (vals[ins.rs1] + ins.imm) & 0xFFFFFFFF
+        vals[ins.rd] = self.pc & 0xFFFFFFFF
+        self.pc = addr - 4
 
     def instruction_sbreak(self, ins: 'Instruction'):
         raise LaunchDebuggerException()
-
-    def parse_crs_ins(self, ins: 'Instruction'):
-        ASSERT_LEN(ins.args, 3)
-        return ins.get_reg(0), ins.get_reg(1), ins.get_imm(2)
-
-    def parse_mem_ins(self, ins: 'Instruction') -> Tuple[str, int]:
-        ASSERT_LEN(ins.args, 3)
-        addr = self.get_reg_content(ins, 1) + ins.get_imm(2)
-        reg = ins.get_reg(0)
-        return reg, addr
@@ -4,23 +4,43 @@ RiscEmu (c) 2021-2022 Anton Lydike
 SPDX-License-Identifier: MIT
 """
 
-from collections import defaultdict
+from typing import Dict, List
 
 from .helpers import *
 from .decoder.regs import X_REGS, RISCV_REGS
+from .types import Int32, UInt32
 
-if typing.TYPE_CHECKING:
-    from .types import Int32
+REGISTER_INDICES: Dict[str, int] = {
+    **{name: i for i, name in enumerate(RISCV_REGS)},
+    **{name: i for i, name in enumerate(X_REGS)},
+}
+"""
+Maps register names (both ABI and x names) to their index in the register file
+"""
 
 
 class Registers:
     """
     Represents a bunch of registers
+
+    The register contents are stored as raw unsigned 32 bit integers in vals, indexed by register number. Use
+    :meth:`read_index` and :meth:`write_index` to resolve register names once, then access vals directly. The vals
+    list is never replaced, so it is safe to keep a reference to it.
+    """
+
+    __slots__ = ('vals', 'last_set', 'last_read')
+
+    ZERO_SINK = len(RISCV_REGS)
     """
+    Index of a scratch slot absorbing all writes to the zero register, so writes never have to check for it
+    """
+
+    vals: List[int]
 
     def __init__(self):
-        from .types import Int32
-        self.vals = defaultdict(lambda: Int32(0))
+        # a plain list is faster than array('I') here: reading from an array creates a new int object every time,
+        # while a list returns the stored one, and all writes are already masked to 32 bits by the handlers
+        self.vals = [0] * (self.ZERO_SINK + 1)
         self.last_set = None
         self.last_read = None
 
@@ -86,7 +106,7 @@ class Registers:
             return FMT_GRAY + txt + FMT_NONE
         return txt
 
-    def set(self, reg, val: 'Int32', mark_set=True) -> bool:
+    def set(self, reg, val: Int32, mark_set=True) -> bool:
         """
         Set a register content to val
         :param reg: The register to set
@@ -94,45 +114,55 @@ class Registers:
         :param mark_set: If True, marks this register as "last accessed" (only used internally)
         :return: If the operation was successful
         """
-        from .types import Int32
         # remove after refactoring is complete
         if not isinstance(val, Int32):
             raise RuntimeError(f"Setting register {reg} to non-Int32 value ({val})! Please refactor your code!")
-        # supporting X registers
-        if reg in X_REGS:
-            reg = RISCV_REGS[X_REGS.index(reg)]
-        if reg == 'zero':
-            return False
-        if reg not in RISCV_REGS:
+        # supports both ABI and X register names
+        idx = REGISTER_INDICES.get(reg)
+        if idx is None:
             raise InvalidRegisterException(reg)
-        # replace fp register with s1, as these are the same register
-        if reg == 'fp':
-            reg = 's1'
+        if idx == 0:
+            return False
         if mark_set:
-            self.last_set = reg
-        # check 32 bit signed bounds
-        self.vals[reg] = val.unsigned()
+            self.last_set = RISCV_REGS[idx]
+        self.vals[idx] = val.unsigned_value
         return True
 
-    def get(self, reg, mark_read=True) -> 'Int32':
+    def get(self, reg, mark_read=True) -> UInt32:
         """
         Retuns the contents of register reg
         :param reg: The register name
         :param mark_read: If the register should be markes as "last read" (only used internally)
         :return: The contents of register reg
         """
-        # supporting X registers
-        if reg in X_REGS:
-            reg = RISCV_REGS[X_REGS.index(reg)]
-        # if reg not in Registers.all_registers():
-        #    raise InvalidRegisterException(reg)
+        idx = self.read_index(reg)
+        if mark_read:
+            self.last_read = RISCV_REGS[idx]
+        return UInt32(self.vals[idx])
+
+    @staticmethod
+    def read_index(reg: str) -> int:
+        """
+        Resolve the name of a register that is read from to its index in vals
+        """
         if reg == 'fp':
             reg = 's0'
-        if reg not in RISCV_REGS:
+        idx = REGISTER_INDICES.get(reg)
+        if idx is None:
             raise ParseException(f'Invalid register "{reg}"')
-        if mark_read:
-            self.last_read = reg
-        return self.vals[reg]
+        return idx
+
+    @classmethod
+    def write_index(cls, reg: str) -> int:
+        """
+        Resolve the name of a register that is written to to its index in vals
+
+        Writes to the zero register are redirected to :attr:`ZERO_SINK`
+        """
+        idx = REGISTER_INDICES.get(reg)
+        if idx is None:
+            raise InvalidRegisterException(reg)
+        return idx if idx != 0 else cls.ZERO_SINK
 
     @staticmethod
     def all_registers():
@@ -7,7 +7,7 @@ SPDX-License-Identifier: MIT
 import re
 from dataclasses import dataclass
 from enum import Enum, auto
-from typing import List, Iterable
+from typing import Dict, List, Iterable, Optional
 
 from riscemu.decoder import RISCV_REGS, X_REGS
 from riscemu.types.exceptions import ParseException
@@ -15,7 +15,12 @@ from riscemu.types.exceptions import ParseException
 LINE_COMMENT_STARTERS = ('#', ';', '//')
 WHITESPACE_PATTERN = re.compile(r'\s+')
 MEMORY_ADDRESS_PATTERN = re.compile(r'^(0[xX][A-f0-9]+|\d+|0b[0-1]+|[A-z0-9_-]+)\(([A-z]+[0-9]{0,2})\)$')
+QUOTED_PART_PATTERN = r'(["\'])(?P<quoted>.*?)(?P<closed>\1|\Z)'
+WHITESPACE_SPLIT_PATTERN = re.compile(QUOTED_PART_PATTERN + r'|(?P<part>[^ \t\n"\']+)', re.DOTALL)
+LINE_SPLIT_PATTERN = re.compile(QUOTED_PART_PATTERN + r'|(?P<part>[^\s"\',]+|,)', re.DOTALL)
 REGISTER_NAMES = RISCV_REGS
+X_TO_ABI = dict(zip(X_REGS, RISCV_REGS))
+ABI_REGISTER_NAMES = frozenset(RISCV_REGS)
 
 
 class TokenType(Enum):
@@ -40,9 +45,34 @@ class Token:
         return '{}({})'.format(self.type.name[0:3], self.value)
 
 
+class _QuotedPart(str):
+    """
+    A part of a line which was enclosed in quotes. It is a single argument, even if it is or contains a comma.
+    """
+
+
 NEWLINE = Token(TokenType.NEWLINE, '\n')
 COMMA = Token(TokenType.COMMA, ',')
 
+# tokens are immutable, so the most common ones are shared instead of creating a new one each time they occur
+_REGISTER_TOKENS: Dict[str, Token] = {reg: Token(TokenType.ARGUMENT, reg) for reg in RISCV_REGS}
+_INSTRUCTION_NAME_TOKENS: Optional[Dict[str, Token]] = None
+"""
+Tokens for the names of all instructions in InstructionSetDict, built on first use by _instruction_name_tokens
+"""
+
+
+def _instruction_name_tokens() -> Dict[str, Token]:
+    global _INSTRUCTION_NAME_TOKENS
+    if _INSTRUCTION_NAME_TOKENS is None:
+        # the instruction sets depend on the parser, which depends on the tokenizer, so they can't be imported earlier
+        from .instructions import InstructionSetDict
+        _INSTRUCTION_NAME_TOKENS = {
+            name: Token(TokenType.INSTRUCTION_NAME, name)
+            for ins_set in InstructionSetDict.values() for name in ins_set.handler_functions
+        }
+    return _INSTRUCTION_NAME_TOKENS
+
 
 def tokenize(input: Iterable[str]) -> Iterable[Token]:
     for line in input:
@@ -52,9 +82,12 @@ def tokenize(input: Iterable[str]) -> Iterable[Token]:
         line.strip(' \t\n')
         if not line:
             continue
-        line = line.replace(',', ' , ') # hack that adds extra white space (but ensures space is there) jds
-        # i'd prefer to do this than rewrite/rename how the tokenizing is done (which essentially assumes white space)
-        parts = list(part for part in split_whitespace_respecting_quotes(line) if part)
+        if '"' in line or "'" in line:
+            # commas outside of quotes are separate parts, so they don't need to be surrounded by whitespace
+            parts = [part for part in _split_respecting_quotes(LINE_SPLIT_PATTERN, line) if part]
+        else:
+            # most lines contain no quotes, these can be split much faster
+            parts = line.replace(',', ' , ').split()
         yield from parse_line(parts)
         yield NEWLINE
 
@@ -71,10 +104,11 @@ def parse_line(parts: List[str]) -> Iterable[Token]:
         yield from parse_line(parts[1:])
         return
     else:
-        yield Token(TokenType.INSTRUCTION_NAME, first_token)
+        tokens = _INSTRUCTION_NAME_TOKENS or _instruction_name_tokens()
+        yield tokens.get(first_token) or Token(TokenType.INSTRUCTION_NAME, first_token)
     need_comma = False
     for part in parts[1:]:
-        if part == ',':
+        if part == ',' and not isinstance(part, _QuotedPart):
             if not need_comma:
                 bad_line = ""
                 for p in parts:
@@ -91,7 +125,7 @@ def parse_line(parts: List[str]) -> Iterable[Token]:
                 raise ParseException(f'Parsing issue: missing comma at [{bad_line}]')
             need_comma = True
             yield from parse_arg(part)
-    if parts[-1]==',':
+    if parts[-1]==',' and not isinstance(parts[-1], _QuotedPart):
         bad_line = ""
         for p in parts:
           bad_line += p + " "
@@ -99,19 +133,22 @@ def parse_line(parts: List[str]) -> Iterable[Token]:
 
 
 def parse_arg(arg: str) -> Iterable[Token]:
+    if isinstance(arg, _QuotedPart):
+        # quoted arguments are taken as they are
+        yield Token(TokenType.ARGUMENT, str(arg))
+        return
     comma = arg[-1] == ','
     arg = arg[:-1] if comma else arg
-    mem_match_resul = re.match(MEMORY_ADDRESS_PATTERN, arg)
+    mem_match_resul = MEMORY_ADDRESS_PATTERN.match(arg)
     if mem_match_resul:
         register = mem_match_resul.group(2).lower()
-        if register in X_REGS:
-            register = RISCV_REGS[X_REGS.index(register)]
-        elif register not in RISCV_REGS:
+        register = X_TO_ABI.get(register, register)
+        if register not in ABI_REGISTER_NAMES:
             raise ParseException(f'Register "{register}" is not a valid register!')
-        yield Token(TokenType.ARGUMENT, register)
+        yield _REGISTER_TOKENS[register]
         yield Token(TokenType.ARGUMENT, mem_match_resul.group(1))
     else:
-        yield Token(TokenType.ARGUMENT, arg)
+        yield _REGISTER_TOKENS.get(arg) or Token(TokenType.ARGUMENT, arg)
     if comma:
         yield COMMA
 
@@ -123,33 +160,15 @@ def print_tokens(tokens: Iterable[Token]):
 
 
 def split_whitespace_respecting_quotes(line: str) -> Iterable[str]:
-    quote = ""
-    part = ""
-    for c in line:
-        if c == quote:
-            yield part
-            part = ""
-            quote = ""
-            continue
-
-        if quote != "":
-            part += c
-            continue
-
-        if c in "\"'":
-            if part:
-                yield part
-            quote = c
-            part = ""
-            continue
-
-        if c in ' \t\n':
-            if part:
-                yield part
-            part = ""
-            continue
-
-        part += c
-
-    if part:
-        yield part
+    return _split_respecting_quotes(WHITESPACE_SPLIT_PATTERN, line)
+
+
+def _split_respecting_quotes(pattern: 're.Pattern', line: str) -> List[str]:
+    """
+    Split line into the parts matched by pattern, quoted parts are returned without their quotes, as _QuotedPart
+    """
+    # findall builds all parts in C, an unmatched group is an empty string. Unquoted parts are never empty, so this
+    # picks whichever group matched. Empty quotes are a part of their own, unless they are left open at the end.
+    return [
+        part or _QuotedPart(quoted) for _, quoted, closed, part in pattern.findall(line) if part or quoted or closed
+    ]
@@ -22,6 +22,7 @@ from .cpu import CPU
 from .simple_instruction import SimpleInstruction
 from .instruction_memory_section import InstructionMemorySection
 from .binary_data_memory_section import BinaryDataMemorySection
+from .decoded_instruction import DecodedInstruction
 
 # exceptions
 from .exceptions import ParseException, NumberFormatException, MemoryAccessException, OutOfMemoryException, \
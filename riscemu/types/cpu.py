@@ -1,6 +1,6 @@
 import typing
 from abc import ABC, abstractmethod
-from typing import List, Type, Callable, Set, Dict
+from typing import List, Type, Callable, Set, Dict, Optional, Tuple
 
 from ..registers import Registers
 from ..config import RunConfig
@@ -24,6 +24,9 @@ class CPU(ABC):
 
     # instruction information
     instructions: Dict[str, Callable[[Instruction], None]]
+    decoders: Dict[str, Callable[[Instruction], Instruction]]
+    fusers: Dict[str, Callable[[Instruction, Instruction, int], Optional[Tuple[Instruction, Instruction]]]]
+    control_flow_instructions: Set[str]
     instruction_sets: Set['InstructionSet']
 
     # configuration
@@ -36,10 +39,16 @@ class CPU(ABC):
 
         self.instruction_sets = set()
         self.instructions = dict()
+        self.decoders = dict()
+        self.fusers = dict()
+        self.control_flow_instructions = set()
 
         for set_class in instruction_sets:
             ins_set = set_class(self)
             self.instructions.update(ins_set.load())
+            self.decoders.update(dict.fromkeys(ins_set.handlers, ins_set.decode))
+            self.fusers.update(dict.fromkeys(ins_set.handlers, ins_set.fuse))
+            self.control_flow_instructions.update(ins_set.control_flow_instructions)
             self.instruction_sets.add(ins_set)
 
         self.halted = False
@@ -53,12 +62,21 @@ class CPU(ABC):
 
         :param ins: The instruction to execute
         """
-        print(ins)
-        if ins.name in self.instructions:
-            self.instructions[ins.name](ins)
-        else:
+        ins = self.decode_instruction(ins)
+        self.instructions[ins.name](ins)
+
+    def decode_instruction(self, ins: Instruction) -> Instruction:
+        """
+        Resolve the operands of ins using the instruction set implementing it, see InstructionSet.decode
+
+        :param ins: The instruction to decode
+        :return: An equivalent instruction, which can be executed by self.instructions[<its name>]
+        """
+        decoder = self.decoders.get(ins.name)
+        if decoder is None:
             # this should never be reached, as unknown instructions are imparseable
             raise RuntimeError("Unknown instruction: {}".format(ins.name))
+        return decoder(ins)
 
     def load_program(self, program: Program):
         self.mmu.load_program(program)
@@ -0,0 +1,51 @@
+from typing import Tuple, Optional
+
+from . import Instruction, BinaryDataMemorySection
+
+
+class DecodedInstruction(Instruction):
+    """
+    An instruction whose operands were resolved once, ahead of execution
+
+    Register operands are stored as indices into the register file (see :class:`riscemu.registers.Registers`), the
+    immediate (if any) is range checked and stored as an int. Handlers can work on raw integers without re-parsing the
+    arguments every time the instruction is executed.
+
+    The wrapped instruction is still accessible through the normal :class:`Instruction` interface.
+    """
+
+    __slots__ = ('ins', 'name', 'args', 'rd', 'rs1', 'rs2', 'imm', 'csr', 'mem_sec')
+
+    def __init__(self, ins: Instruction):
+        self.ins = ins
+        self.name = ins.name
+        self.args = ins.args
+        self.rd = 0
+        self.rs1 = 0
+        self.rs2 = 0
+        self.imm = 0
+        # the address of the control and status register accessed by the privileged csr instructions
+        self.csr = 0
+        # the section accessed by the last execution of a load or store, see InstructionSet.read_mem
+        self.mem_sec: Optional[BinaryDataMemorySection] = None
+
+    def copy(self) -> 'DecodedInstruction':
+        """
+        Returns a copy of this instruction with the same name and operands
+        """
+        ins = DecodedInstruction(self.ins)
+        ins.name, ins.rd, ins.rs1, ins.rs2 = self.name, self.rd, self.rs1, self.rs2
+        ins.imm, ins.csr = self.imm, self.csr
+        return ins
+
+    def get_imm(self, num: int) -> int:
+        return self.ins.get_imm(num)
+
+    def get_imm_reg(self, num: int) -> Tuple[int, str]:
+        return self.ins.get_imm_reg(num)
+
+    def get_reg(self, num: int) -> str:
+        return self.ins.get_reg(num)
+
+    def __repr__(self):
+        return repr(self.ins)
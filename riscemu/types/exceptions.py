@@ -33,25 +33,32 @@ class ParseException(RiscemuBaseException):
     def message(self):
         return FMT_PARSE + "{}(\"{}\", data={})".format(self.__class__.__name__, self.msg, self.data) + FMT_NONE
 
+_IMM_BOUNDS = dict()
+"""
+Maps (nbits, signed) to the range of values accepted by ASSERT_IMM_LEN, and the bounds reported if a value is outside
+"""
+
+
+def _imm_bounds(nbits, signed):
+    if not signed:
+        return 0, 2**nbits - 1, 0, 2**nbits - 1
+    max_p = 2**(nbits-1)-1
+    min_p = -(2**(nbits-1))
+    # in case of hex/binary spec, values with a leading 1 are reinterpreted as negative values (val - 2**nbits)
+    # before comparing, so values up to 2**nbits + max_p are accepted
+    return min_p, 2**nbits + max_p, min_p, max_p
+
+
 def ASSERT_IMM_LEN(val, nbits, signed=True):
-    if signed==False:
-        max_p = 2**(nbits)-1
-        min_p = 0
-        # relatively easy to sort this one
-        if val>max_p or val<min_p:
-            #pass
-            raise ParseException("IMMEDIATE OUT OF RANGE FOR UNSIGNED: Value {} out of bounds [{},{}]".format(val,min_p,max_p), (val,))
-    else: #signed (note for sign extension):
-        max_p = 2**(nbits-1)-1
-        min_p = -(2**(nbits-1))
-        if val>max_p:  #in case of hex/binary spec check if we have leading 1
-            nval = -(2**(nbits)-val) #if so reinterpret this as negative value (nval)...then compare.
-            if nval>max_p or nval<min_p: #still report back using val to avoid confusion
-                raise ParseException("IMMEDIATE OUT OF RANGE FOR SIGNED: Value {} out of bounds [{},{}]".format(val,min_p,max_p), (val,))
-        else: #if number was "small" enough or specified with signed integer.
-            if val>max_p or val<min_p:
-                #pass
-                raise ParseException("IMMEDIATE OUT OF RANGE FOR SIGNED: Value {} out of bounds [{},{}]".format(val,min_p,max_p), (val,))
+    signed = signed != False
+    bounds = _IMM_BOUNDS.get((nbits, signed))
+    if bounds is None:
+        bounds = _IMM_BOUNDS[(nbits, signed)] = _imm_bounds(nbits, signed)
+    lowest, highest, min_p, max_p = bounds
+    if val < lowest or val > highest:
+        raise ParseException("IMMEDIATE OUT OF RANGE FOR {}: Value {} out of bounds [{},{}]".format(
+            'SIGNED' if signed else 'UNSIGNED', val, min_p, max_p
+        ), (val,))
 
 def ASSERT_EQ(a1, a2):
     if a1 != a2:
@@ -113,7 +120,13 @@ class MemoryAlignmentException(RiscemuBaseException):
 
 
 def ASSERT_WORD_ALIGNED(address, ins):
+    """
+    ins is either a description of the executed instruction, or the load/store instruction itself, which is only
+    formatted as "<name> rd, imm(rs1)" if the address is actually misaligned
+    """
     if address % 4 != 0:
+      if not isinstance(ins, str):
+          ins = "{} {}, {}({})".format(ins.name, ins.get_reg(0), ins.get_imm(2), ins.get_reg(1))
       raise MemoryAlignmentException("During execution of {}: Memory address 0x{:08x} is not a multiple of {}!".format(ins, address, 4))
 
 
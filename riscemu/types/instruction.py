@@ -3,6 +3,9 @@ from typing import Tuple
 
 
 class Instruction(ABC):
+    # instructions are accessed in every cycle, subclasses should declare __slots__ as well
+    __slots__ = ()
+
     name: str
     args: tuple
 
@@ -251,6 +251,7 @@ class UInt32(Int32):
     An unsigned version of :class:Int32.
     """
     _type = c_uint32
+    __slots__ = ()
 
     def unsigned(self) -> 'UInt32':
         """
@@ -1,21 +1,28 @@
-from typing import Union, Tuple
+from typing import Union, Tuple, Dict
 
 from . import Instruction, T_RelativeAddress, InstructionContext
 from ..helpers import parse_numeric_argument
 
 
 class SimpleInstruction(Instruction):
+    __slots__ = ('context', 'name', 'args', 'addr', '_resolved_imms')
+
     def __init__(self, name: str, args: Union[Tuple[()], Tuple[str], Tuple[str, str], Tuple[str, str, str]],
                  context: InstructionContext, addr: T_RelativeAddress):
         self.context = context
         self.name = name
         self.args = args
         self.addr = addr
+        # arguments don't change after parsing, so every immediate only needs to be resolved once
+        self._resolved_imms: Dict[int, int] = dict()
 
     def get_imm(self, num: int) -> int:
+        if num in self._resolved_imms:
+            return self._resolved_imms[num]
         resolved_label = self.context.resolve_label(self.args[num], self.addr)
         if resolved_label is None:
-            return parse_numeric_argument(self.args[num])
+            resolved_label = parse_numeric_argument(self.args[num])
+        self._resolved_imms[num] = resolved_label
         return resolved_label
 
     def get_imm_reg(self, num: int) -> Tuple[int, str]:
@@ -1,3 +1,8 @@
 from .test_tokenizer import *
 from .test_helpers import *
-from .test_integers import *
\ No newline at end of file
+from .test_integers import *
+from .test_cpu import *
+from .test_instructions import *
+from .test_mmu import *
+from .test_exceptions import *
+from .test_priv import *
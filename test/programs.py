@@ -0,0 +1,47 @@
+import contextlib
+import io
+from typing import Iterable, Optional, Tuple, Type
+
+from riscemu import UserModeCPU, RunConfig, InstructionSetDict, InstructionSet, tokenize, parse_tokens
+from riscemu.types import MemorySection
+
+EXIT = """
+    li utilreg, 93
+    ecall
+"""
+"""
+Exits the program with the exit code in a0
+"""
+
+
+def run_program(source: str, instruction_sets: Optional[Iterable[Type[InstructionSet]]] = None,
+                jit_threshold: Optional[int] = None, sections: Iterable[MemorySection] = ()) -> Tuple[UserModeCPU, str]:
+    """
+    Assemble source and run it on a new UserModeCPU, starting at the label starttoo
+
+    :param instruction_sets: The instruction sets of the cpu, defaults to all of them
+    :param jit_threshold: Overrides the JIT_THRESHOLD of the cpu, 1 compiles every block after its first execution
+    :param sections: Additional memory sections, loaded at their base address
+    :return: The cpu after it halted, and everything printed while running the program
+    """
+    if instruction_sets is None:
+        instruction_sets = InstructionSetDict.values()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        cpu = UserModeCPU(list(instruction_sets), RunConfig(debug_on_exception=False))
+        if jit_threshold is not None:
+            cpu.JIT_THRESHOLD = jit_threshold
+        program = parse_tokens('test.asm', tokenize(source.splitlines()))
+        cpu.load_program(program)
+        for sec in sections:
+            cpu.mmu.load_section(sec, fixed_position=True)
+        cpu.setup_stack(cpu.conf.stack_size)
+        cpu.launch(program)
+    return cpu, output.getvalue()
+
+
+def reg(cpu: UserModeCPU, name: str) -> int:
+    """
+    The unsigned contents of register name
+    """
+    return cpu.regs.get(name, False).unsigned_value
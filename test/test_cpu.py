@@ -0,0 +1,298 @@
+import contextlib
+import io
+from unittest import TestCase
+
+from riscemu import InstructionSet, InstructionSetDict, RunConfig
+from riscemu.priv.types import ElfMemorySection
+from riscemu.types import Instruction, DecodedInstruction, InstructionContext, MemoryFlags
+
+from .programs import run_program, reg, EXIT
+
+
+class ControlIS(InstructionSet):
+    """
+    Instructions halting the cpu or changing the pc. Only loophalt is declared as a control flow instruction.
+    """
+
+    operand_formats = {
+        'haltz': ('rs1',),
+        'skipnz': ('rs1',),
+        'loophalt': ('rs1', 'imm'),
+    }
+
+    control_flow_instructions = frozenset(('loophalt',))
+
+    def instruction_halt(self, ins: Instruction):
+        self.cpu.halted = True
+
+    def instruction_skip(self, ins: Instruction):
+        self.cpu.pc += 8
+
+    def instruction_haltz(self, ins: DecodedInstruction):
+        if self.vals[ins.rs1] == 0:
+            self.cpu.halted = True
+
+    def instruction_skipnz(self, ins: DecodedInstruction):
+        if self.vals[ins.rs1] != 0:
+            self.cpu.pc += 4
+
+    def instruction_loophalt(self, ins: DecodedInstruction):
+        # jumps to imm, and halts the cpu once rs1 is zero. It must not be executed again after that.
+        assert not self.cpu.halted
+        self.cpu.pc = ins.imm
+        if self.vals[ins.rs1] == 0:
+            self.cpu.halted = True
+
+
+INSTRUCTION_SETS = [*InstructionSetDict.values(), ControlIS]
+
+
+class TestBasicBlocks(TestCase):
+
+    def test_halt(self):
+        cpu, _ = run_program("""
+starttoo:
+    halt
+    li a1, 7
+    li a2, 100
+""" + EXIT, INSTRUCTION_SETS)
+        self.assertTrue(cpu.halted)
+        self.assertEqual(reg(cpu, 'a1'), 0)
+        self.assertEqual(reg(cpu, 'a2'), 0)
+
+    def test_skip(self):
+        cpu, _ = run_program("""
+starttoo:
+    skip
+    li a1, 7
+    li a2, 100
+    li a3, 1
+""" + EXIT, INSTRUCTION_SETS)
+        self.assertEqual(reg(cpu, 'a1'), 0)
+        self.assertEqual(reg(cpu, 'a2'), 0)
+        self.assertEqual(reg(cpu, 'a3'), 1)
+
+    def test_decoded_halt_inside_block(self):
+        for jit_threshold in (None, 1):
+            with self.subTest(jit_threshold=jit_threshold):
+                self._run_decoded_halt(jit_threshold)
+
+    def test_decoded_skip_inside_block(self):
+        for jit_threshold in (None, 1):
+            with self.subTest(jit_threshold=jit_threshold):
+                self._run_decoded_skip(jit_threshold)
+
+    def _run_decoded_halt(self, jit_threshold):
+        cpu, _ = run_program("""
+starttoo:
+    li t0, 10
+loop:
+    addi t0, t0, -1
+    haltz t0
+    addi a1, a1, 1
+    j next
+next:
+    j loop
+""", INSTRUCTION_SETS, jit_threshold)
+        self.assertTrue(cpu.halted)
+        self.assertEqual(reg(cpu, 'a1'), 9)
+
+    def _run_decoded_skip(self, jit_threshold):
+        cpu, _ = run_program("""
+starttoo:
+    li t0, 20
+loop:
+    addi t0, t0, -1
+    addi a1, a1, 1
+    skipnz t0
+    addi a2, a2, 1
+    bnez t0, loop
+""" + EXIT, INSTRUCTION_SETS, jit_threshold)
+        self.assertEqual(reg(cpu, 'a1'), 20)
+        self.assertEqual(reg(cpu, 'a2'), 1)
+
+    def test_halt_in_single_block_loop(self):
+        for jit_threshold in (None, 1):
+            with self.subTest(jit_threshold=jit_threshold):
+                cpu, _ = run_program("""
+starttoo:
+    li t0, 10
+loop:
+    addi t0, t0, -1
+    addi a1, a1, 1
+    loophalt t0, loop
+""", INSTRUCTION_SETS, jit_threshold)
+                self.assertTrue(cpu.halted)
+                self.assertEqual(reg(cpu, 'a1'), 10)
+
+    def test_cycles_on_decode_error(self):
+        # like in step, the instruction failing to decode at the start of a block counts as a cycle
+        for jit_threshold in (None, 1):
+            with self.subTest(jit_threshold=jit_threshold):
+                with contextlib.redirect_stderr(io.StringIO()):
+                    cpu, output = run_program("""
+starttoo:
+    addi a0, a0, 1
+    j invalid
+invalid:
+    add a0, a1, foo
+""", jit_threshold=jit_threshold)
+                self.assertIn('Invalid register', output)
+                self.assertTrue(cpu.halted)
+                self.assertEqual(cpu.cycle, 3)
+
+
+class TestFusion(TestCase):
+
+    def assertRegisters(self, source: str, **expected: int):
+        """
+        Run source interpreted and with every block compiled, and check the final register contents
+        """
+        for jit_threshold in (None, 1):
+            with self.subTest(jit_threshold=jit_threshold):
+                cpu, _ = run_program(source + EXIT, jit_threshold=jit_threshold)
+                for name, val in expected.items():
+                    self.assertEqual(reg(cpu, name), val, name)
+
+    def test_negative_low_immediate(self):
+        self.assertRegisters("""
+starttoo:
+    lui a1, 0x12345
+    addi a1, a1, -1
+    lui a2, 0xFFFFF
+    addi a2, a2, -2048
+    auipc a3, 0x10
+    addi a3, a3, -2048
+    auipc a4, 0
+    sub a3, a3, a4
+    addi a5, a5, -2048
+    addi a5, a5, -2048
+    addi a6, a6, 5
+    addi a6, a6, -7
+""", a1=0x12344FFF, a2=0xFFFFE800, a3=0x10000 - 2048 - 8, a5=2 ** 32 - 4096, a6=2 ** 32 - 2)
+
+    def test_different_registers(self):
+        self.assertRegisters("""
+starttoo:
+    li a2, 7
+    lui a1, 0x12345
+    addi a3, a1, 1
+    lui a4, 1
+    addi a4, a2, 1
+    addi a5, a2, 3
+    addi a5, a5, 4
+    addi a6, a6, 3
+    addi a7, a6, 4
+""", a1=0x12345000, a3=0x12345001, a4=8, a5=14, a6=3, a7=7)
+
+    def test_zero_register(self):
+        self.assertRegisters("""
+starttoo:
+    lui zero, 0x12345
+    addi zero, zero, 1
+    mv a1, zero
+    addi zero, zero, 5
+    addi zero, zero, 5
+    mv a2, zero
+    lui a3, 1
+    addi zero, a3, 1
+    mv a4, zero
+""", zero=0, a1=0, a2=0, a3=0x1000, a4=0)
+
+    def test_branch_to_second_instruction(self):
+        # the block starting at loop fuses lui and addi, the jump to second has to execute the addi alone
+        self.assertRegisters("""
+starttoo:
+    li t0, 3
+loop:
+    lui a1, 1
+second:
+    addi a1, a1, 1
+    add a2, a2, a1
+    addi t0, t0, -1
+    bnez t0, loop
+    bnez t1, done
+    li t0, 1
+    li t1, 1
+    li a1, 100
+    li a2, 0
+    j second
+done:
+""", a1=101, a2=101)
+
+
+class TestStackCheck(TestCase):
+
+    def test_overflow(self):
+        for jit_threshold in (None, 1):
+            with self.subTest(jit_threshold=jit_threshold):
+                errors = io.StringIO()
+                with contextlib.redirect_stderr(errors):
+                    cpu, output = run_program("""
+starttoo:
+    addi sp, sp, -2040
+    sw zero, 0(sp)
+    j starttoo
+""" + EXIT, jit_threshold=jit_threshold)
+                stack_limit = cpu.conf.stack_size - 4096
+                self.assertTrue(cpu.halted)
+                self.assertIn('Halting due to exception', output)
+                self.assertIn('StackOverflowException', errors.getvalue())
+                # the overflow is detected by the addi crossing the limit
+                self.assertLess(reg(cpu, 'sp'), stack_limit)
+                self.assertGreaterEqual(reg(cpu, 'sp'), stack_limit - 2040)
+
+    def test_access_through_sp(self):
+        for jit_threshold in (None, 1):
+            with self.subTest(jit_threshold=jit_threshold):
+                stack_limit = RunConfig().stack_size - 4096
+                cpu, output = run_program("""
+starttoo:
+    li sp, {}
+    li t0, 3
+loop:
+    sw t0, -16(sp)
+    lw a1, -16(sp)
+    sb t0, -2048(sp)
+    mv a2, sp
+    addi t0, t0, -1
+    bnez t0, loop
+    li a0, 7
+""".format(stack_limit) + EXIT, jit_threshold=jit_threshold)
+                self.assertNotIn('Halting due to exception', output)
+                self.assertEqual(cpu.exit_code, 7)
+                self.assertEqual(reg(cpu, 'a1'), 1)
+                self.assertEqual(reg(cpu, 'a2'), stack_limit)
+
+
+def encode_addi(rd: int, rs1: int, imm: int) -> int:
+    return ((imm & 0xFFF) << 20) | (rs1 << 15) | (rd << 7) | 0b0010011
+
+
+class TestSelfModifyingCode(TestCase):
+
+    def test_overwrite_executed_code(self):
+        # the function at 0x100000 is addi a0, a0, 1 followed by ret, and is changed to addi a0, a0, 100 after four calls
+        ret = (1 << 15) | 0b1100111
+        code = b''.join(word.to_bytes(4, 'little') for word in (encode_addi(10, 10, 1), ret))
+        for jit_threshold in (None, 1):
+            with self.subTest(jit_threshold=jit_threshold):
+                sec = ElfMemorySection(bytearray(code), '.code', InstructionContext(), 'test', 0x100000,
+                                       MemoryFlags(read_only=False, executable=True))
+                cpu, _ = run_program("""
+starttoo:
+    li s0, 0x100000
+    li s1, 4
+loop:
+    jalr ra, s0, 0
+    addi s1, s1, -1
+    bnez s1, loop
+    bnez s3, done
+    li s2, {}
+    sw s2, 0(s0)
+    li s3, 1
+    li s1, 4
+    j loop
+done:
+""".format(encode_addi(10, 10, 100)) + EXIT, jit_threshold=jit_threshold, sections=[sec])
+                self.assertEqual(reg(cpu, 'a0'), 4 * 1 + 4 * 100)
@@ -0,0 +1,50 @@
+from unittest import TestCase
+
+from riscemu.types.exceptions import ASSERT_IMM_LEN, ParseException
+
+
+class TestAssertImmLen(TestCase):
+
+    def assertAccepted(self, val, nbits, signed):
+        try:
+            ASSERT_IMM_LEN(val, nbits, signed)
+        except ParseException:
+            self.fail('{} rejected as {} bit {} immediate'.format(val, nbits, 'signed' if signed else 'unsigned'))
+
+    def assertRejected(self, val, nbits, signed):
+        with self.assertRaises(ParseException) as context:
+            ASSERT_IMM_LEN(val, nbits, signed)
+        # the reported bounds are the ones of the immediate, not of the accepted values
+        lowest, highest = (-2 ** (nbits - 1), 2 ** (nbits - 1) - 1) if signed else (0, 2 ** nbits - 1)
+        self.assertIn('out of bounds [{},{}]'.format(lowest, highest), context.exception.msg)
+
+    def test_signed(self):
+        for nbits in (5, 12, 20):
+            with self.subTest(nbits=nbits):
+                self.assertAccepted(-2 ** (nbits - 1), nbits, True)
+                self.assertAccepted(2 ** (nbits - 1) - 1, nbits, True)
+                self.assertAccepted(0, nbits, True)
+                self.assertRejected(-2 ** (nbits - 1) - 1, nbits, True)
+
+    def test_signed_with_leading_one(self):
+        # values written in hex or binary with the sign bit set, e.g. 0xFFF for -1, are reinterpreted as negative
+        for nbits in (5, 12, 20):
+            with self.subTest(nbits=nbits):
+                self.assertAccepted(2 ** (nbits - 1), nbits, True)
+                self.assertAccepted(2 ** nbits - 1, nbits, True)
+                self.assertAccepted(2 ** nbits + 2 ** (nbits - 1) - 1, nbits, True)
+                self.assertRejected(2 ** nbits + 2 ** (nbits - 1), nbits, True)
+
+    def test_unsigned(self):
+        for nbits in (5, 12, 20):
+            with self.subTest(nbits=nbits):
+                self.assertAccepted(0, nbits, False)
+                self.assertAccepted(2 ** nbits - 1, nbits, False)
+                self.assertRejected(-1, nbits, False)
+                self.assertRejected(2 ** nbits, nbits, False)
+
+    def test_signed_flag(self):
+        # anything but False means signed
+        self.assertAccepted(-1, 12, None)
+        self.assertAccepted(-1, 12, 1)
+        self.assertRejected(-1, 12, False)
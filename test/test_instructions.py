@@ -0,0 +1,149 @@
+from unittest import TestCase
+
+from .programs import run_program, reg, EXIT
+
+
+def in_loop(body: str, iterations: int = 3) -> str:
+    """
+    Wrap body in a loop, so it is interpreted first and runs as a compiled block afterwards when the JIT_THRESHOLD is 1
+    """
+    return """
+starttoo:
+    li t0, {}
+loop:
+{}
+    addi t0, t0, -1
+    bnez t0, loop
+""".format(iterations, body) + EXIT
+
+
+class TestRV32I(TestCase):
+
+    def test_slt(self):
+        pairs = [(-1, 1), (1, -1), (-5, -3), (-3, -5), (3, 5), (5, 3), (-7, -7), (-2 ** 31, 2 ** 31 - 1)]
+        for a, b in pairs:
+            for jit_threshold in (None, 1):
+                with self.subTest(a=a, b=b, jit_threshold=jit_threshold):
+                    cpu, _ = run_program(in_loop("""
+    li s0, {a}
+    li s1, {b}
+    slt a1, s0, s1
+    slt a2, s1, s0
+    sltu a3, s0, s1
+""".format(a=a, b=b)), jit_threshold=jit_threshold)
+                    self.assertEqual(reg(cpu, 'a1'), int(a < b))
+                    self.assertEqual(reg(cpu, 'a2'), int(b < a))
+                    self.assertEqual(reg(cpu, 'a3'), int(a % 2 ** 32 < b % 2 ** 32))
+
+    def test_slti(self):
+        pairs = [(-1, 1), (1, -1), (-5, -3), (-3, -5), (3, 5), (5, 3), (-7, -7), (-2 ** 31, 2047), (2 ** 31 - 1, -2048)]
+        for a, imm in pairs:
+            for jit_threshold in (None, 1):
+                with self.subTest(a=a, imm=imm, jit_threshold=jit_threshold):
+                    cpu, _ = run_program(in_loop("""
+    li s0, {a}
+    slti a1, s0, {imm}
+""".format(a=a, imm=imm)), jit_threshold=jit_threshold)
+                    self.assertEqual(reg(cpu, 'a1'), int(a < imm))
+
+    def test_zero_source_register(self):
+        for jit_threshold in (None, 1):
+            with self.subTest(jit_threshold=jit_threshold):
+                cpu, _ = run_program(in_loop("""
+    li s0, -3
+    li s1, 9
+    add a1, zero, s1
+    add a2, s0, x0
+    or a3, zero, s0
+    xor a4, s1, zero
+    sub a5, s0, zero
+    sub a6, zero, s1
+    sll a7, s1, zero
+    sra s2, s0, zero
+    addi s3, s0, 0
+    addi s4, zero, -7
+    ori s5, zero, 5
+    xori s6, zero, -1
+    xori s7, s1, -1
+"""), jit_threshold=jit_threshold)
+                expected = dict(a1=9, a2=-3, a3=-3, a4=9, a5=-3, a6=-9, a7=9, s2=-3, s3=-3, s4=-7, s5=5, s6=-1, s7=-10)
+                for name, val in expected.items():
+                    self.assertEqual(reg(cpu, name), val % 2 ** 32, name)
+
+    def test_zero_destination_register(self):
+        for jit_threshold in (None, 1):
+            with self.subTest(jit_threshold=jit_threshold):
+                cpu, _ = run_program(in_loop("""
+    li s0, -3
+    li s1, 9
+    add zero, s0, s1
+    addi x0, s1, 1
+    lui zero, 1
+    slt zero, s0, s1
+    mv zero, s1
+    li zero, 5
+    mv a1, zero
+    addi a2, zero, 0
+    jal zero, next
+next:
+"""), jit_threshold=jit_threshold)
+                self.assertEqual(reg(cpu, 'zero'), 0)
+                self.assertEqual(reg(cpu, 'a1'), 0)
+                self.assertEqual(reg(cpu, 'a2'), 0)
+                self.assertEqual(reg(cpu, 'ra'), 0)
+
+    def test_branch_against_zero_register(self):
+        conditions = {
+            'beq': lambda a, b: a == b,
+            'bne': lambda a, b: a != b,
+            'blt': lambda a, b: a < b,
+            'bge': lambda a, b: a >= b,
+        }
+        for name, condition in conditions.items():
+            for val in (-3, 0, 5):
+                for rs1, rs2, a, b in (('s0', 'zero', val, 0), ('zero', 's0', 0, val)):
+                    for jit_threshold in (None, 1):
+                        with self.subTest(ins='{} {}, {}'.format(name, rs1, rs2), val=val, jit_threshold=jit_threshold):
+                            cpu, _ = run_program(in_loop("""
+    li s0, {val}
+    li a1, 0
+    {name} {rs1}, {rs2}, taken
+    j done
+taken:
+    li a1, 1
+done:
+""".format(name=name, rs1=rs1, rs2=rs2, val=val)), jit_threshold=jit_threshold)
+                            self.assertEqual(reg(cpu, 'a1'), int(condition(a, b)))
+
+
+class TestRV32A(TestCase):
+
+    OPERATIONS = {
+        'amoswap.w': lambda old, val: val,
+        'amoadd.w': lambda old, val: old + val,
+        'amoand.w': lambda old, val: old & val,
+        'amoor.w': lambda old, val: old | val,
+        'amoxor.w': lambda old, val: old ^ val,
+        'amomax.w': max,
+        'amomaxu.w': lambda old, val: max(old % 2 ** 32, val % 2 ** 32),
+        'amomin.w': min,
+        'amominu.w': lambda old, val: min(old % 2 ** 32, val % 2 ** 32),
+    }
+
+    def test_amo(self):
+        for name, op in self.OPERATIONS.items():
+            for old, val in ((5, -3), (-3, 5), (-1, 7), (2 ** 31 - 1, 1)):
+                with self.subTest(name=name, old=old, val=val):
+                    cpu, _ = run_program("""
+.data
+word:
+    .word {old}
+.text
+starttoo:
+    la a1, word
+    li a2, {val}
+    {name} a0, a1, a2
+    lw a3, 0(a1)
+""".format(name=name, old=old, val=val) + EXIT)
+                    self.assertEqual(reg(cpu, 'a0'), old % 2 ** 32)
+                    self.assertEqual(reg(cpu, 'a3'), op(old, val) % 2 ** 32)
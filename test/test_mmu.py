@@ -0,0 +1,92 @@
+import contextlib
+import io
+from unittest import TestCase
+
+from riscemu.MMU import MMU
+from riscemu.priv.types import ElfMemorySection
+from riscemu.types import BinaryDataMemorySection, InstructionContext, MemoryFlags
+from riscemu.types.exceptions import MemoryAccessException
+
+
+class TestMMU(TestCase):
+
+    def setUp(self):
+        self.mmu = MMU()
+        # a plain data section, which the MMU accesses in place, and a subclass going through its read and write methods
+        self.data = BinaryDataMemorySection(bytearray(16), '.data', InstructionContext(), 'test', 0x100)
+        self.elf_data = ElfMemorySection(bytearray(16), '.elf', InstructionContext(), 'test', 0x200,
+                                         MemoryFlags(read_only=False, executable=False))
+        self.mmu.load_section(self.data, fixed_position=True)
+        self.mmu.load_section(self.elf_data, fixed_position=True)
+
+    def assertRaisesAccess(self):
+        """
+        Expect a MemoryAccessException, and hide the message the MMU prints for it
+        """
+        stack = contextlib.ExitStack()
+        stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+        stack.enter_context(self.assertRaises(MemoryAccessException))
+        return stack
+
+    def test_write_int(self):
+        for sec in (self.data, self.elf_data):
+            with self.subTest(sec=sec.name):
+                self.mmu.write(sec.base, 4, 0x12345678)
+                self.mmu.write(sec.base + 4, 2, 0xABCD)
+                self.mmu.write(sec.base + 6, 1, 0xEF)
+                self.assertEqual(sec.data[:8], bytearray([0x78, 0x56, 0x34, 0x12, 0xCD, 0xAB, 0xEF, 0]))
+                self.assertEqual(self.mmu.read(sec.base, 4), bytearray([0x78, 0x56, 0x34, 0x12]))
+
+    def test_write_int_truncates(self):
+        for sec in (self.data, self.elf_data):
+            with self.subTest(sec=sec.name):
+                self.mmu.write(sec.base, 4, -2)
+                self.mmu.write(sec.base + 4, 1, 0x1FF)
+                self.mmu.write(sec.base + 6, 2, 0x123456)
+                self.assertEqual(sec.data[:8], bytearray([0xFE, 0xFF, 0xFF, 0xFF, 0xFF, 0, 0x56, 0x34]))
+
+    def test_write_int_unaligned(self):
+        for sec in (self.data, self.elf_data):
+            with self.subTest(sec=sec.name):
+                self.mmu.write(sec.base + 3, 4, 0x11223344)
+                self.assertEqual(sec.data[:8], bytearray([0, 0, 0, 0x44, 0x33, 0x22, 0x11, 0]))
+
+    def test_write_bytes(self):
+        self.mmu.write(self.data.base + 1, 2, bytearray([1, 2, 3]))
+        self.assertEqual(self.data.data[:4], bytearray([0, 1, 2, 0]))
+
+    def test_write_out_of_bounds(self):
+        for sec in (self.data, self.elf_data):
+            with self.subTest(sec=sec.name):
+                with self.assertRaisesAccess():
+                    self.mmu.write(sec.base + 14, 4, 0x12345678)
+                self.assertEqual(sec.data, bytearray(16))
+        with self.assertRaisesAccess():
+            self.mmu.write(0x300, 4, 1)
+
+    def test_read_uint(self):
+        for sec in (self.data, self.elf_data):
+            with self.subTest(sec=sec.name):
+                sec.data[:8] = bytearray([0x78, 0x56, 0x34, 0x12, 0xCD, 0xAB, 0xEF, 0xFF])
+                self.assertEqual(self.mmu.read_uint(sec.base, 4), 0x12345678)
+                self.assertEqual(self.mmu.read_uint(sec.base + 4, 2), 0xABCD)
+                self.assertEqual(self.mmu.read_uint(sec.base + 7, 1), 0xFF)
+                self.assertEqual(self.mmu.read_uint(sec.base + 5, 4), 0xFFEFAB)
+
+    def test_read_uint_round_trip(self):
+        for sec in (self.data, self.elf_data):
+            for size in (1, 2, 4):
+                for val in (0, 1, 0x80 << (8 * size - 8), (1 << (8 * size)) - 1):
+                    with self.subTest(sec=sec.name, size=size, val=val):
+                        self.mmu.write(sec.base + 12, size, val)
+                        self.assertEqual(self.mmu.read_uint(sec.base + 12, size), val)
+
+    def test_read_uint_out_of_bounds(self):
+        for sec in (self.data, self.elf_data):
+            with self.subTest(sec=sec.name):
+                with self.assertRaisesAccess():
+                    self.mmu.read_uint(sec.base + 14, 4)
+                with self.assertRaisesAccess():
+                    self.mmu.read_uint(sec.base + 15, 2)
+        with self.assertRaisesAccess():
+            self.mmu.read_uint(0x300, 4)
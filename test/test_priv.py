@@ -0,0 +1,143 @@
+import contextlib
+import io
+from unittest import TestCase
+
+from riscemu import RunConfig, tokenize, parse_tokens
+from riscemu.priv.Exceptions import InstructionAccessFault
+from riscemu.priv.PrivCPU import PrivCPU
+from riscemu.priv.privmodes import PrivModes
+from riscemu.types import Int32
+
+
+def load_kernel(source: str) -> PrivCPU:
+    """
+    Assemble source and load it into a new PrivCPU, with the pc at its first instruction
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        cpu = PrivCPU(RunConfig())
+        program = parse_tokens('kernel', tokenize(source.splitlines()))
+        cpu.load_program(program)
+    cpu.pc = program.base
+    return cpu
+
+
+class TestPrivBranches(TestCase):
+
+    CONDITIONS = {
+        'beq': lambda a, b: a == b,
+        'bne': lambda a, b: a != b,
+        'blt': lambda a, b: a < b,
+        'bge': lambda a, b: a >= b,
+        'bltu': lambda a, b: a % 2 ** 32 < b % 2 ** 32,
+        'bgeu': lambda a, b: a % 2 ** 32 >= b % 2 ** 32,
+    }
+
+    def test_branches(self):
+        # branch offsets are relative to the branch itself. Like in the original implementation, the offsets of
+        # bltu and bgeu are unsigned immediates, so they can only branch forward
+        for name, condition in self.CONDITIONS.items():
+            offsets = (8,) if name in ('bltu', 'bgeu') else (8, -4)
+            for a, b in ((1, -1), (-1, 1), (5, 5), (-5, -5), (2 ** 31 - 1, -2 ** 31), (0, 3)):
+                for offset in offsets:
+                    with self.subTest(name=name, a=a, b=b, offset=offset):
+                        cpu = load_kernel("""
+.text
+    addi zero, zero, 0
+    {} a0, a1, {}
+    addi zero, zero, 0
+    addi zero, zero, 0
+""".format(name, offset))
+                        start = cpu.pc + 4
+                        cpu.pc = start
+                        cpu.regs.set('a0', Int32(a))
+                        cpu.regs.set('a1', Int32(b))
+                        cpu.step(False)
+                        self.assertEqual(cpu.pc, start + offset if condition(a, b) else start + 4)
+
+    def test_branch_against_zero(self):
+        cpu = load_kernel("""
+.text
+    blt zero, a0, 8
+    addi zero, zero, 0
+    bge a0, zero, -8
+""")
+        start = cpu.pc
+        cpu.regs.set('a0', Int32(-3))
+        cpu.step(False)
+        self.assertEqual(cpu.pc, start + 4)
+        cpu.regs.set('a0', Int32(3))
+        cpu.pc = start
+        cpu.step(False)
+        self.assertEqual(cpu.pc, start + 8)
+        cpu.step(False)
+        self.assertEqual(cpu.pc, start)
+
+
+class TestPrivJumps(TestCase):
+
+    def test_jal_jalr(self):
+        # like in the original implementation, the link register holds the address of the jump itself
+        cpu = load_kernel("""
+.text
+    jal ra, 12
+    addi zero, zero, 0
+    jal zero, -8
+    jalr a1, ra, 8
+""")
+        start = cpu.pc
+        cpu.step(False)
+        self.assertEqual(cpu.pc, start + 12)
+        self.assertEqual(cpu.regs.get('ra').unsigned_value, start)
+        cpu.step(False)
+        self.assertEqual(cpu.pc, start + 8)
+        self.assertEqual(cpu.regs.get('a1').unsigned_value, start + 12)
+        cpu.step(False)
+        self.assertEqual(cpu.pc, start)
+        self.assertEqual(cpu.regs.get('zero').unsigned_value, 0)
+
+    def test_jalr_same_register(self):
+        # the target is computed from rs1 before rd is written
+        cpu = load_kernel("""
+.text
+    jalr a0, a0, -4
+""")
+        start = cpu.pc
+        cpu.regs.set('a0', Int32(start + 0x104))
+        cpu.step(False)
+        self.assertEqual(cpu.pc, start + 0x100)
+        self.assertEqual(cpu.regs.get('a0').unsigned_value, start)
+
+
+class TestPrivCsr(TestCase):
+
+    def test_csr_instructions(self):
+        cpu = load_kernel("""
+.text
+    csrrw a0, a1, 0x340
+    csrrs a2, zero, 0x340
+    csrrwi a3, 7, 0x340
+    csrrw zero, a0, 0x340
+""")
+        cpu.regs.set('a1', Int32(-5))
+        cpu.csr.set(0x340, 3)
+        cpu.step(False)
+        self.assertEqual(cpu.regs.get('a0').unsigned_value, 3)
+        self.assertEqual(cpu.csr.get(0x340).unsigned_value, 2 ** 32 - 5)
+        cpu.step(False)
+        self.assertEqual(cpu.regs.get('a2').unsigned_value, 2 ** 32 - 5)
+        cpu.step(False)
+        self.assertEqual(cpu.regs.get('a3').unsigned_value, 2 ** 32 - 5)
+        self.assertEqual(cpu.csr.get(0x340).unsigned_value, 7)
+        cpu.step(False)
+        self.assertEqual(cpu.csr.get(0x340).unsigned_value, 3)
+        self.assertEqual(cpu.regs.get('zero').unsigned_value, 0)
+
+    def test_csr_access_from_user_mode(self):
+        cpu = load_kernel("""
+.text
+    csrrw a0, a1, 0x340
+""")
+        cpu.mode = PrivModes.USER
+        with self.assertRaises(InstructionAccessFault):
+            cpu.run_instruction(cpu.mmu.read_ins(cpu.pc))
+        self.assertEqual(cpu.regs.get('a0').unsigned_value, 0)
@@ -1,7 +1,7 @@
 from unittest import TestCase
 
 from riscemu.tokenizer import tokenize, print_tokens, Token, TokenType, NEWLINE, COMMA, \
-    split_whitespace_respecting_quotes
+    split_whitespace_respecting_quotes, _instruction_name_tokens
 
 
 def ins(name: str) -> Token:
@@ -124,3 +124,27 @@ section:
         self.assertEqual(
             list(split_whitespace_respecting_quotes('hello"test 123"abc')), ["hello", "test 123", "abc"]
         )
+
+    def test_split_whitespace_respecting_quotes_open_quotes(self):
+        self.assertEqual(list(split_whitespace_respecting_quotes('"')), [])
+        self.assertEqual(list(split_whitespace_respecting_quotes('1"')), ['1'])
+        self.assertEqual(list(split_whitespace_respecting_quotes('1 "abc')), ['1', 'abc'])
+        self.assertEqual(list(split_whitespace_respecting_quotes('a "" b')), ['a', '', 'b'])
+
+    def test_commas_in_quotes(self):
+        self.assertEqual(
+            list(tokenize(['.ascii "a, b",c'])), [op('.ascii'), arg('a, b'), COMMA, arg('c'), NEWLINE]
+        )
+
+    def test_quoted_commas(self):
+        self.assertEqual(list(tokenize(['.ascii ","'])), [op('.ascii'), arg(','), NEWLINE])
+        self.assertEqual(list(tokenize(["li a0, ','"])), [ins('li'), arg('a0'), COMMA, arg(','), NEWLINE])
+        self.assertEqual(list(tokenize(['.ascii "a,"'])), [op('.ascii'), arg('a,'), NEWLINE])
+        self.assertEqual(list(tokenize(['.ascii ",", "b"'])), [op('.ascii'), arg(','), COMMA, arg('b'), NEWLINE])
+
+    def test_unknown_instruction_names(self):
+        known = len(_instruction_name_tokens())
+        names = ['unknown{}'.format(i) for i in range(100)]
+        self.assertEqual(list(tokenize(names)), [token for name in names for token in (ins(name), NEWLINE)])
+        self.assertEqual(len(_instruction_name_tokens()), known)
+        self.assertIs(next(iter(tokenize(['addi a0, a0, 1']))), _instruction_name_tokens()['addi'])